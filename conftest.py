@@ -1,6 +1,7 @@
 import logging
 
 import matplotlib
+import pytest
 
 logging.getLogger("matplotlib").setLevel(logging.WARNING)
 # doesn't work because ffcx changes the log-level at runtime, which is not good.
@@ -14,3 +15,9 @@ def pytest_addoption(parser):
 def pytest_configure(config):
     if config.getoption("hide_plots"):
         matplotlib.use("agg")
+
+
+@pytest.fixture
+def hide_plots(request):
+    """Whether the plots should be skipped (e.g. in headless test runs)."""
+    return request.config.getoption("hide_plots")
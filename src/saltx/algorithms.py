@@ -113,12 +113,50 @@ class Evaluator:
         self.cells = cells
 
         self.femfunction = fem.Function(V)
+        # (dofs, basis function values) of the cell of each point (see
+        # _tabulate_basis_values)
+        self._basis_values: list[tuple[np.ndarray, np.ndarray]] | None = None
+
+    def _tabulate_basis_values(self) -> list[tuple[np.ndarray, np.ndarray]]:
+        # The evaluation of a function at a point is linear in the dof values of the
+        # cell that contains the point. Hence, the values of the basis functions of
+        # this cell are determined (once) by evaluating the unit vectors.
+        bs = self.V.dofmap.bs
+        values = self.femfunction.x.array
+        basis_values = []
+        for point, cell in zip(self.points_on_proc, self.cells):
+            cell_dofs = (
+                bs * self.V.dofmap.cell_dofs(cell)[:, np.newaxis] + np.arange(bs)
+            ).flatten()
+            unit_values = []
+            for dof in cell_dofs:
+                values[:] = 0.0
+                values[dof] = 1.0
+                unit_values.append(self.femfunction.eval(point, [cell]).flatten())
+            basis_values.append((cell_dofs, np.array(unit_values)))
+        return basis_values
 
     def __call__(self, mode) -> np.ndarray:
-        self.femfunction.x.array[:] = (
-            mode if isinstance(mode, np.ndarray) else mode.array
+        array = mode if isinstance(mode, np.ndarray) else mode.array
+        if array.ndim == 1:
+            if not self.cells:
+                # none of the points is on this process
+                return np.empty(0, dtype=array.dtype)
+            self.femfunction.x.array[:] = array
+            return self.femfunction.eval(self.points_on_proc, self.cells).flatten()
+
+        # array contains the dof values of multiple modes (one mode per row), which
+        # are evaluated at once (one row of the returned array per mode)
+        if self._basis_values is None:
+            self._basis_values = self._tabulate_basis_values()
+        if not self._basis_values:
+            return np.empty((array.shape[0], 0), dtype=array.dtype)
+        return np.hstack(
+            [
+                array[:, cell_dofs] @ unit_values
+                for cell_dofs, unit_values in self._basis_values
+            ]
         )
-        return self.femfunction.eval(self.points_on_proc, self.cells).flatten()
 
 
 def get_nevp_modes(
@@ -226,7 +264,7 @@ def get_nevp_modes(
         mode = x.getArray().copy()
 
         dof_at_maximum = np.abs(mode).argmax()
-        val_maximum = mode[np.abs(mode).argmax()]
+        val_maximum = mode[dof_at_maximum]
         Print(
             f" {_lam.real:9f}{_lam.imag:+9f} j {res:12g}   "
             f"{val_maximum.real:2g} j {val_maximum.imag:2g}"
@@ -435,6 +473,38 @@ def _refine_modes(
     return real_modes
 
 
+def stack_D0_and_evals(D0: float, evals: np.ndarray) -> np.ndarray:
+    """Return an array with D0 in the first and the evals in the second column."""
+    D0_and_evals = np.empty((evals.size, 2), dtype=np.complex128)
+    D0_and_evals[:, 0] = D0
+    D0_and_evals[:, 1] = evals
+    return D0_and_evals
+
+
+def set_pump_matrix(Q: PETSc.Mat, Q_unit: PETSc.Mat, D0: float) -> None:
+    """Set the NEVP pump matrix Q to D0 * Q_unit.
+
+    Q is linear in D0, i.e., Q_unit is the pump matrix for D0=1. Note that
+    all the values of Q are overwritten, including the hole burning term
+    that constant_pump_algorithm assembles into Q for the previous D0.
+    """
+    Q_unit.copy(Q, structure=PETSc.Mat.Structure.SAME_NONZERO_PATTERN)
+    Q.scale(D0)
+
+
+def count_modes_around_real_axis(
+    imag_evals: np.ndarray, threshold: float = 1e-10
+) -> tuple[int, int]:
+    """Return the number of modes close to and above the real axis."""
+    number_of_modes_close_to_real_axis = np.count_nonzero(
+        np.abs(imag_evals) < threshold
+    )
+    Print(f"Number of modes close to real axis: {number_of_modes_close_to_real_axis}")
+    number_of_modes_above_real_axis = np.count_nonzero(imag_evals > threshold)
+    Print(f"Number of modes above real axis: {number_of_modes_above_real_axis}")
+    return number_of_modes_close_to_real_axis, number_of_modes_above_real_axis
+
+
 def constant_pump_algorithm(
     nevp_modes: list[NEVPNonLasingMode],
     nevp_inputs: NEVPInputs,
@@ -502,19 +572,15 @@ def constant_pump_algorithm(
         modes = get_nevp_modes(nevp_inputs)
         evals = np.asarray([mode.k for mode in modes])
 
-        number_of_modes_close_to_real_axis = np.sum(
-            np.abs(evals.imag) < real_axis_threshold
-        )
-        Print(
-            f"Number of modes close to real axis: {number_of_modes_close_to_real_axis}"
-        )
+        (
+            number_of_modes_close_to_real_axis,
+            number_of_modes_above_real_axis,
+        ) = count_modes_around_real_axis(evals.imag, real_axis_threshold)
 
         assert number_of_modes_close_to_real_axis == active_modes
 
         # TODO add a couple of sanity checks (refined_modes vs modes)
 
-        number_of_modes_above_real_axis = np.sum(evals.imag > real_axis_threshold)
-        Print(f"Number of modes above real axis: {number_of_modes_above_real_axis}")
         if number_of_modes_above_real_axis == 0:
             return refined_modes
 
@@ -11,14 +11,21 @@ from saltx.log import Timer
 
 log = logging.getLogger(__name__)
 
+# The same dict is passed to all fem.form calls in saltx, s.t. all the (cached) FFCx
+# modules are compiled with the same flags. Note that -Ofast is not used, because
+# -ffast-math doesn't preserve the IEEE semantics of the complex arithmetic.
+JIT_OPTIONS = {"cffi_extra_compile_args": ["-O3", "-march=native"]}
+
 
 def assemble_form(form, bcs, diag=1.0, mat=None):
     if isinstance(form, fem.forms.FormMetaClass):
-        log.error("fem.form form already created")
+        # Note that this is the preferred way of calling this function in loops,
+        # because the form is only compiled once.
+        log.debug("fem.form form already created")
         fform = form
     else:
         with Timer(log.error, "assemble_form"):
-            fform = fem.form(form)
+            fform = fem.form(form, jit_options=JIT_OPTIONS)
 
     if mat is None:
         mat = fem.petsc.assemble_matrix(fform, bcs=bcs, diagonal=diag)
@@ -32,7 +32,7 @@ def create_salt_jacobian_block_matrix(dF_dvw: PETSc.Mat, nmodes: int = 1) -> PET
     N = two_nmodes_n + 2 * nmodes
     n = two_nmodes_n // (2 * nmodes)
 
-    with Timer(print, "getValuesCSR"):
+    with Timer(log.debug, "getValuesCSR"):
         rows_ind, cols, values = dF_dvw.getValuesCSR()
 
     assert rows_ind.size - 1 == 2 * n * nmodes
@@ -140,7 +140,7 @@ def create_salt_jacobian_block_matrix(dF_dvw: PETSc.Mat, nmodes: int = 1) -> PET
     assert final_cols.dtype == np.int32
     assert final_values.dtype == np.complex128
 
-    with Timer(print, "createAIJ"):
+    with Timer(log.debug, "createAIJ"):
         A = PETSc.Mat().createAIJWithArrays(
             (N, N),
             (final_rows_ind, final_cols, final_values),
@@ -227,10 +227,12 @@ def assemble_salt_jacobian_block_matrix(
     # column vectors
     # we have 2*nmodes additional col vectors
     # k1, s1, k2, s2, ...., k_nmodes, s_nmodes
+    # the row indices are the same for all the column vectors
+    col_vector_rows = np.arange(2 * n * nmodes, dtype=PETSc.IntType)
     for kidx, dF_dk in enumerate(dFReIm_dk_seq):
         col_idx = 2 * n * nmodes + 2 * kidx
         A.setValues(
-            range(2 * n * nmodes),
+            col_vector_rows,
             col_idx,
             dF_dk.array.real,
             addv=addv,
@@ -238,7 +240,7 @@ def assemble_salt_jacobian_block_matrix(
     for sidx, dF_ds in enumerate(dFReIm_ds_seq):
         col_idx = 2 * n * nmodes + 2 * sidx + 1
         A.setValues(
-            range(2 * n * nmodes),
+            col_vector_rows,
             col_idx,
             dF_ds.array.real,
             addv=addv,
@@ -287,33 +289,25 @@ def assemble_complex_singlemode_jacobian_matrix(
 
     rows_ind, cols, values = dF_du.getValuesCSR()
 
-    cols_to = cols
-    rows_ind_to = np.empty(
-        N + 1, dtype=np.int32
-    )  # +1 because rows_ind_to[0] is always 0
-    _idx = 0
-    rows_ind_to[_idx : _idx + len(rows_ind)] = rows_ind
-    _idx = _idx + len(rows_ind)
-    rows_ind_to[_idx:] = len(values)
-
-    A.setValuesCSR(rows_ind_to, cols_to, values, addv=PETSc.InsertMode.ADD)
-
-    # column vectors
-    A.setValues(
-        range(n),
-        n,
-        dF_dk,
-        addv=PETSc.InsertMode.ADD,
+    # All the values of A are inserted with a single setValuesCSR call:
+    # * the column vector dF_dk is appended to every row of dF_du
+    # * the last row contains the row vector e^T (a single 1 at dof_at_maximum) and
+    #   the diagonal entry, which is needed s.t. PETSc doesn't complain that the
+    #   diagonal entry is missing (see
+    #   https://lists.mcs.anl.gov/pipermail/petsc-users/2016-October/030704.html)
+    row_ends = rows_ind[1:]
+    rows_ind_to = np.empty(N + 1, dtype=np.int32)  # +1 because rows_ind_to[0] is 0
+    rows_ind_to[:-1] = rows_ind + np.arange(n + 1, dtype=np.int32)
+    rows_ind_to[-1] = rows_ind_to[-2] + 2
+
+    cols_to = np.concatenate(
+        [np.insert(cols, row_ends, n), [dof_at_maximum, n]], dtype=np.int32
+    )
+    values_to = np.concatenate(
+        [np.insert(values, row_ends, dF_dk.getArray(readonly=True)), [1.0, 0j]]
     )
 
-    # row vectors
-    A.setValue(n, dof_at_maximum, 1.0, addv=PETSc.InsertMode.ADD)
-
-    # scalars
-
-    # this is needed s.t. PETSc doesn't complain that the diagonal entry is missing (see
-    # https://lists.mcs.anl.gov/pipermail/petsc-users/2016-October/030704.html)
-    A.setValue(n, n, 0j, addv=PETSc.InsertMode.ADD)
+    A.setValuesCSR(rows_ind_to, cols_to, values_to, addv=PETSc.InsertMode.ADD)
 
     t1 = time.monotonic()
     A.assemble()
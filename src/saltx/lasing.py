@@ -3,6 +3,7 @@
 # This file is part of saltx (https://github.com/thisch/saltx)
 #
 # SPDX-License-Identifier:    LGPL-3.0-or-later
+import itertools
 import logging
 import numbers
 import operator
@@ -16,6 +17,7 @@ from petsc4py import PETSc
 from ufl import dx, elem_mult, inner, nabla_grad
 
 from saltx import jacobian
+from saltx.assemble import JIT_OPTIONS
 from saltx.log import Timer
 
 log = logging.getLogger(__name__)
@@ -30,6 +32,19 @@ class MatVecCollection(NamedTuple):
     vec_dF_dk_seq: list[PETSc.Vec]
     vec_dF_ds_seq: list[PETSc.Vec]
 
+    # the bcs for all the (re, im) subspaces of the modes
+    block_bcs: list[fem.DirichletBCMetaClass]
+    # the bcs (of V) from which block_bcs were created
+    bcs: list[fem.DirichletBCMetaClass]
+
+
+class KConstants(NamedTuple):
+    # real valued functions of the (real valued) k of a mode
+    krat: fem.Constant  # (k - ka) / gt
+    Gk: fem.Constant
+    dGk_dk: fem.Constant
+    k2Gk: fem.Constant  # k**2 * Gk
+
 
 class NonLinearProblem:
     def __init__(
@@ -45,10 +60,11 @@ class NonLinearProblem:
         max_nmodes=5,
     ):
         self.V = V
-        self.Ws = [V.clone() for _ in range(max_nmodes * 2)]
         self.mesh = V.mesh
         self.ka = fem.Constant(V.mesh, complex(ka, 0))
         self.gt = fem.Constant(V.mesh, complex(gt, 0))
+        # updated together with the k constants (see _update_k_constants)
+        self.inv_gt = fem.Constant(V.mesh, complex(1 / gt, 0))
 
         self.dielec = dielec
         self.invperm = invperm or 1
@@ -75,9 +91,18 @@ class NonLinearProblem:
             (fem.Constant(self.mesh, 0j), fem.Constant(self.mesh, 0j))
             for _ in range(max_nmodes)
         ]
+        # these constants are updated together with the k constants in
+        # _form_constants (see _update_k_constants)
+        self._k_constants = [
+            KConstants(*(fem.Constant(self.mesh, 0j) for _ in KConstants._fields))
+            for _ in range(max_nmodes)
+        ]
         self._max_spaces = [(self.V.clone(), self.V.clone()) for _ in range(max_nmodes)]
-        self._k_hbt_constants = [
-            # k_hbt (k is real valued)
+        # the (re, im) subspaces of all modes, i.e., no additional clones of V are
+        # needed for the block matrix scaffold in create_A.
+        self.Ws = list(itertools.chain.from_iterable(self._max_spaces))
+        self._Gk_hbt_constants = [
+            # |gamma(k_hbt)|**2 (see update_b_and_k_for_forms)
             fem.Constant(self.mesh, complex(1.0, 0.0))
             for _ in range(max_nmodes)
         ]
@@ -91,35 +116,52 @@ class NonLinearProblem:
     def update_b_and_k_for_forms(self, refined_modes) -> None:
         assert len(refined_modes) <= len(self._b_vectors)
 
-        for refined_mode, b, k in zip(
-            refined_modes, self._b_vectors, self._k_hbt_constants
+        ka = self.ka.value
+        gt = self.gt.value
+        for refined_mode, b, Gk in zip(
+            refined_modes, self._b_vectors, self._Gk_hbt_constants
         ):
             b.x.array[:] = refined_mode.array
-            k.value = refined_mode.k
+            # the (real-valued) prefactor of |b|**2 in the hole burning term is
+            # evaluated here and not at every quadrature point of the Q form
+            Gk.value = abs(gt / (refined_mode.k - ka + 1j * gt)) ** 2
+
+    def _update_k_constants(self, k_constants: KConstants, k: float) -> None:
+        ka = self.ka.value.real
+        gt = self.gt.value.real
+
+        denom = (k - ka) ** 2 + gt**2
+        Gk = gt**2 / denom  # in Reals
+        k_constants.krat.value = (k - ka) / gt
+        k_constants.Gk.value = Gk
+        k_constants.dGk_dk.value = -2 * (k - ka) / denom * Gk  # p. 116
+        k_constants.k2Gk.value = k**2 * Gk
+        # 1/gt is also updated here s.t. it is consistent with krat (even if gt is
+        # changed after the initialization)
+        self.inv_gt.value = 1 / gt
 
     def get_Q_hbt_form(self, nmodes: int) -> fem.forms.FormMetaClass:
         try:
             return self._cur_Q_hbt_forms[nmodes]
         except KeyError:
             Q_hbt_form = self._create_Q_hbt_form(nmodes)
-            self._cur_Q_hbt_forms[Q_hbt_form] = Q_hbt_form
+            self._cur_Q_hbt_forms[nmodes] = Q_hbt_form
             return Q_hbt_form
 
     def _create_Q_hbt_form(self, nmodes: int) -> fem.forms.FormMetaClass:
         u = ufl.TrialFunction(self.V)
         v = ufl.TestFunction(self.V)
 
-        ka = self.ka
-        gt = self.gt
         sht = 0
-        for midx, (b, k) in enumerate(zip(self._b_vectors, self._k_hbt_constants)):
+        for midx, (b, Gk) in enumerate(zip(self._b_vectors, self._Gk_hbt_constants)):
             if midx == nmodes:
                 break
-            gk = gt / (k - ka + 1j * gt)
-            sht += abs(gk * b) ** 2
+            sht += Gk * abs(b) ** 2
 
         # create the final Q form
-        return fem.form(self.pump / (1 + sht) * inner(u, v) * dx)
+        return fem.form(
+            self.pump / (1 + sht) * inner(u, v) * dx, jit_options=JIT_OPTIONS
+        )
 
     def _create_newton_forms(self, nmodes):
         spaces = self._max_spaces[:nmodes]
@@ -137,34 +179,68 @@ class NonLinearProblem:
         # invperm has a real and an imaginary part
         invp = self.invperm
 
-        gt = self.gt
-        ka = self.ka
-
-        # invperm has a real and an imaginary part
-        invp = self.invperm
-
         # gammak = lambda k: gt / (k - ka + 1j * gt)
         # dgammak_dk = lambda k: -gt / (k - ka + 1j * gt) ** 2
-        def Gk(k):
-            return gt**2 / ((k - ka) ** 2 + gt**2)  # in Reals
+        # The following sub-expressions only depend on the constants of a single mode.
+        # They are created only once per mode s.t. the same UFL objects are reused in
+        # all the forms below (instead of creating new UFL trees at every call site).
+        # The real valued functions of k (Gk, krat, ...) are fem.Constants, which are
+        # evaluated in assemble_F_and_J.
+        Gk_map, dGk_dk_map, krat_map = {}, {}, {}
+        k2_map, two_k_map, k2Gk_map = {}, {}, {}
+        # derivatives of the prefactors k**2*Gk and k**2*krat*Gk of Q w.r.t. k
+        dk2Gk_dk_map, dk2Gkkrat_dk_map = {}, {}
+        # the contribution of the mode to sht and its derivatives w.r.t. k and s
+        sht_map, dsht_dk_map, dsht_ds_map = {}, {}, {}
+        inv_gt = self.inv_gt
+        for (b, k, s), k_constants in zip(modes_data, self._k_constants):
+            Gk_map[k] = k_constants.Gk
+            dGk_dk_map[k] = k_constants.dGk_dk
+            krat_map[k] = k_constants.krat
+            k2_map[k] = k**2
+            two_k_map[k] = 2 * k
+            k2Gk_map[k] = k_constants.k2Gk
+            dk2Gk_dk_map[k] = two_k_map[k] * Gk_map[k] + k2_map[k] * dGk_dk_map[k]
+            dk2Gkkrat_dk_map[k] = dk2Gk_dk_map[k] * krat_map[k] + k2Gk_map[k] * inv_gt
+            abs_b2 = abs(b) ** 2
+            sht_map[k] = Gk_map[k] * s**2 * abs_b2
+            dsht_dk_map[k] = dGk_dk_map[k] * s**2 * abs_b2
+            dsht_ds_map[k] = Gk_map[k] * 2 * s * abs_b2
+        del b, k, s
 
-        def dGk_dk(k):
-            return -2 * (k - ka) / ((k - ka) ** 2 + gt**2) * Gk(k)  # p. 116
+        def Gk(k):
+            return Gk_map[k]
 
-        sht = sum(Gk(k) * s**2 * abs(b) ** 2 for (b, k, s) in modes_data)
+        sht = sum(sht_map[k] for (_, k, _) in modes_data)
+        # pump/(1+sht) and pump/(1+sht)**2 appear in all Q and dQ forms
+        pump_sht = pump / (1 + sht)
+        pump_sht2 = pump / (1 + sht) ** 2
 
         curl = self._curl
         mult = self._mult
 
-        F_components = []
+        # F_components, the dF_dk/dF_ds columns and a_form_array are filled by the
+        # (block) index of the modes
+        F_components = [None] * (2 * nmodes)
+
+        # The real and imaginary parts of the material parameters are created only once
+        # and the builders of the imaginary parts are specialized for real valued
+        # parameters.
+        invp_re = ufl.real(invp)
 
         def Lre(testf, trialf):
-            return inner(mult(ufl.real(invp), curl(trialf)), curl(testf)) * dx
+            return inner(mult(invp_re, curl(trialf)), curl(testf)) * dx
 
-        def Lim(testf, trialf):
-            if isinstance(invp, numbers.Real):
+        if isinstance(invp, numbers.Real):
+
+            def Lim(testf, trialf):
                 return 0
-            return inner(mult(ufl.imag(invp), curl(trialf)), curl(testf)) * dx
+
+        else:
+            invp_im = ufl.imag(invp)
+
+            def Lim(testf, trialf):
+                return inner(mult(invp_im, curl(trialf)), curl(testf)) * dx
 
         def R(testf, trialf):
             if self.ds_obc is None:
@@ -176,61 +252,69 @@ class NonLinearProblem:
                 return self.zero
             return self.sigma_c * inner(trialf, testf) * dx
 
+        dielec_re = ufl.real(dielec)
+
         def Mre(testf, trialf):
-            return ufl.real(dielec) * inner(trialf, testf) * dx
+            return dielec_re * inner(trialf, testf) * dx
 
-        def Mim(testf, trialf):
-            if isinstance(dielec, numbers.Real):
+        if isinstance(dielec, numbers.Real):
+
+            def Mim(testf, trialf):
                 return 0
-            return ufl.imag(dielec) * inner(trialf, testf) * dx
+
+        else:
+            dielec_im = ufl.imag(dielec)
+
+            def Mim(testf, trialf):
+                return dielec_im * inner(trialf, testf) * dx
 
         def Q(testf, trialf):
-            return pump / (1 + sht) * inner(trialf, testf) * dx
+            return pump_sht * inner(trialf, testf) * dx
 
         def dQ_dx(testf, trialf, dsht_dx):
             # x is either k or s
-            denom = (1 + sht) ** 2
-            return -dsht_dx * pump / denom * inner(trialf, testf) * dx
+            return -dsht_dx * pump_sht2 * inner(trialf, testf) * dx
 
         def dQx_dy(testf, trialf, x_row, y_col, k_col, s_col):
             # the derivative is w.r.t the mode y
-            denom = (1 + sht) ** 2
             return (
                 (-2 * s_col**2 * Gk(k_col))
-                / denom
-                * (pump * x_row * y_col * inner(trialf, testf))
+                * pump_sht2
+                * (x_row * y_col * inner(trialf, testf))
                 * dx
             )
 
-        def calc_Fre_and_Fim(b, k, re_space, im_space):
+        def calc_Fre_and_Fim(mode_index, b, k, re_space, im_space):
             re, im = ufl.TestFunction(re_space), ufl.TestFunction(im_space)
 
             v = ufl.real(b)
             w = ufl.imag(b)
-            krat = (k - ka) / gt
+            krat = krat_map[k]
+            k2 = k2_map[k]
+            k2Gk = k2Gk_map[k]
 
-            # Sb = -formL + 1j * k * R + k**2 * M + k**2 * gammak * Q
+            # Sb = -formL + 1j * k * R + k2 * M + k2 * gammak * Q
             F_re = (
                 # mult with v
                 -Lre(re, v)
-                + k**2 * Mre(re, v)
-                + k**2 * krat * Gk(k) * Q(re, v)
+                + k2 * Mre(re, v)
+                + k2Gk * krat * Q(re, v)
                 # mult with w
                 + Lim(re, w)
                 - k * R(re, w)
-                - k**2 * Mim(re, w)
-                + k**2 * Gk(k) * Q(re, w)
+                - k2 * Mim(re, w)
+                + k2Gk * Q(re, w)
             )
             F_im = (
                 # mult with v
                 -Lim(im, v)
                 + k * R(im, v)
-                + k**2 * Mim(im, v)
-                - k**2 * Gk(k) * Q(im, v)
+                + k2 * Mim(im, v)
+                - k2Gk * Q(im, v)
                 # multi with w
                 - Lre(im, w)
-                + k**2 * Mre(im, w)
-                + k**2 * krat * Gk(k) * Q(im, w)
+                + k2 * Mre(im, w)
+                + k2Gk * krat * Q(im, w)
             )
 
             # Fre + i*Fim =
@@ -254,54 +338,60 @@ class NonLinearProblem:
                 F_re += -k * self.sigma_c * inner(w, re) * dx
                 F_im += k * self.sigma_c * inner(v, im) * dx
 
-            F_components.append(F_re)
-            F_components.append(F_im)
+            off = 2 * mode_index
+            F_components[off] = F_re
+            F_components[off + 1] = F_im
 
         def calc_dF_dk_and_dF_ds(
-            local_dF_dk_column, local_dF_ds_column, b, k, s, re_space, im_space
+            local_dF_dk_column,
+            local_dF_ds_column,
+            mode_index,
+            b,
+            k,
+            s,
+            re_space,
+            im_space,
         ):
             # this is for the diagonal blocks
             re, im = ufl.TestFunction(re_space), ufl.TestFunction(im_space)
 
             v = ufl.real(b)
             w = ufl.imag(b)
-            krat = (k - ka) / gt
+            krat = krat_map[k]
+            k2Gk = k2Gk_map[k]
+            two_k = two_k_map[k]
+            dk2Gk_dk = dk2Gk_dk_map[k]
+            dk2Gkkrat_dk = dk2Gkkrat_dk_map[k]
 
             # todo do this for all ks
             # -> create ufl ticket
             # dF_re_dk0 = ufl.derivative(F_re, k)
             # dF_im_dk0 = ufl.derivative(F_im, k)
 
-            dsht_dk = dGk_dk(k) * s**2 * abs(b) ** 2
-            dsht_ds = Gk(k) * 2 * s * abs(b) ** 2
+            dsht_dk = dsht_dk_map[k]
+            dsht_ds = dsht_ds_map[k]
 
             dF_re_dk = (
                 # mult with v
-                2 * k * Mre(re, v)
-                + 2 * k * krat * Gk(k) * Q(re, v)
-                + k**2 * (1 / gt) * Gk(k) * Q(re, v)
-                + k**2 * krat * dGk_dk(k) * Q(re, v)
-                + k**2 * krat * Gk(k) * dQ_dx(re, v, dsht_dk)
+                two_k * Mre(re, v)
+                + dk2Gkkrat_dk * Q(re, v)
+                + k2Gk * krat * dQ_dx(re, v, dsht_dk)
                 # mult with w
                 - R(re, w)
-                - 2 * k * Mim(re, w)
-                + 2 * k * Gk(k) * Q(re, w)
-                + k**2 * dGk_dk(k) * Q(re, w)
-                + k**2 * Gk(k) * dQ_dx(re, w, dsht_dk)
+                - two_k * Mim(re, w)
+                + dk2Gk_dk * Q(re, w)
+                + k2Gk * dQ_dx(re, w, dsht_dk)
             )
             dF_im_dk = (
                 # mult with v
                 R(im, v)
-                + 2 * k * Mim(im, v)
-                - 2 * k * Gk(k) * Q(im, v)
-                - k**2 * dGk_dk(k) * Q(im, v)
-                - k**2 * Gk(k) * dQ_dx(im, v, dsht_dk)
+                + two_k * Mim(im, v)
+                - dk2Gk_dk * Q(im, v)
+                - k2Gk * dQ_dx(im, v, dsht_dk)
                 # multi with w
-                + 2 * k * Mre(im, w)
-                + 2 * k * krat * Gk(k) * Q(im, w)
-                + k**2 * (1 / gt) * Gk(k) * Q(im, w)
-                + k**2 * krat * dGk_dk(k) * Q(im, w)
-                + k**2 * krat * Gk(k) * dQ_dx(im, w, dsht_dk)
+                + two_k * Mre(im, w)
+                + dk2Gkkrat_dk * Q(im, w)
+                + k2Gk * krat * dQ_dx(im, w, dsht_dk)
             )
 
             if self.sigma_c is not None:
@@ -309,25 +399,29 @@ class NonLinearProblem:
                 dF_re_dk += -self.sigma_c * inner(w, re) * dx
                 dF_im_dk += self.sigma_c * inner(v, im) * dx
 
-            local_dF_dk_column.extend([dF_re_dk, dF_im_dk])
+            off = 2 * mode_index
+            local_dF_dk_column[off] = dF_re_dk
+            local_dF_dk_column[off + 1] = dF_im_dk
 
             dF_re_ds = (
                 # mult with v
-                k**2 * krat * Gk(k) * dQ_dx(re, v, dsht_ds)
+                k2Gk * krat * dQ_dx(re, v, dsht_ds)
                 # mult with w
-                + k**2 * Gk(k) * dQ_dx(re, w, dsht_ds)
+                + k2Gk * dQ_dx(re, w, dsht_ds)
             )
             dF_im_ds = (
                 # mult with v
-                -(k**2) * Gk(k) * dQ_dx(im, v, dsht_ds)
+                -k2Gk * dQ_dx(im, v, dsht_ds)
                 # multi with w
-                + k**2 * krat * Gk(k) * dQ_dx(im, w, dsht_ds)
+                + k2Gk * krat * dQ_dx(im, w, dsht_ds)
             )
-            local_dF_ds_column.extend([dF_re_ds, dF_im_ds])
+            local_dF_ds_column[off] = dF_re_ds
+            local_dF_ds_column[off + 1] = dF_im_ds
 
         def calc_dFx_dky_and_dFx_dsy(
             local_dF_dk_column,
             local_dF_ds_column,
+            mode_row_index,
             bx,
             kx,
             sx,
@@ -344,26 +438,30 @@ class NonLinearProblem:
 
             v = ufl.real(bx)
             w = ufl.imag(bx)
-            kxrat = (kx - ka) / gt
-
-            dsht_dky = dGk_dk(ky) * sy**2 * abs(by) ** 2
-            dsht_dsy = Gk(ky) * 2 * sy * abs(by) ** 2
-
-            dF_re_dk = +(kx**2) * kxrat * Gk(kx) * dQ_dx(
-                rex, v, dsht_dky
-            ) + kx**2 * Gk(kx) * dQ_dx(rex, w, dsht_dky)
-            dF_im_dk = -(kx**2) * Gk(kx) * dQ_dx(
-                imx, v, dsht_dky
-            ) + kx**2 * kxrat * Gk(kx) * dQ_dx(imx, w, dsht_dky)
-            local_dF_dk_column.extend([dF_re_dk, dF_im_dk])
-
-            dF_re_ds = kx**2 * kxrat * Gk(kx) * dQ_dx(
-                rex, v, dsht_dsy
-            ) + kx**2 * Gk(kx) * dQ_dx(rex, w, dsht_dsy)
-            dF_im_ds = -(kx**2) * Gk(kx) * dQ_dx(
-                imx, v, dsht_dsy
-            ) + kx**2 * kxrat * Gk(kx) * dQ_dx(imx, w, dsht_dsy)
-            local_dF_ds_column.extend([dF_re_ds, dF_im_ds])
+            kxrat = krat_map[kx]
+            kx2Gk = k2Gk_map[kx]
+
+            dsht_dky = dsht_dk_map[ky]
+            dsht_dsy = dsht_ds_map[ky]
+
+            dF_re_dk = +kx2Gk * kxrat * dQ_dx(rex, v, dsht_dky) + kx2Gk * dQ_dx(
+                rex, w, dsht_dky
+            )
+            dF_im_dk = -kx2Gk * dQ_dx(imx, v, dsht_dky) + kx2Gk * kxrat * dQ_dx(
+                imx, w, dsht_dky
+            )
+            offy = 2 * mode_row_index
+            local_dF_dk_column[offy] = dF_re_dk
+            local_dF_dk_column[offy + 1] = dF_im_dk
+
+            dF_re_ds = kx2Gk * kxrat * dQ_dx(rex, v, dsht_dsy) + kx2Gk * dQ_dx(
+                rex, w, dsht_dsy
+            )
+            dF_im_ds = -kx2Gk * dQ_dx(imx, v, dsht_dsy) + kx2Gk * kxrat * dQ_dx(
+                imx, w, dsht_dsy
+            )
+            local_dF_ds_column[offy] = dF_re_ds
+            local_dF_ds_column[offy + 1] = dF_im_ds
 
         def call_A_diag_block(mode_index, b, k, s, Wre, Wim):
             v = ufl.real(b)
@@ -373,13 +471,14 @@ class NonLinearProblem:
             # Note that the test spaces are on the row spaces
             test_re, test_im = ufl.TestFunction(Wre), ufl.TestFunction(Wim)
 
-            krat = (k - ka) / gt
-            k2Gk = k**2 * Gk(k)
+            krat = krat_map[k]
+            k2 = k2_map[k]
+            k2Gk = k2Gk_map[k]
 
             # diag terms in the current (diag) block:
             dFRe_dv = (
                 -Lre(test_re, tri_re)
-                + k**2 * Mre(test_re, tri_re)
+                + k2 * Mre(test_re, tri_re)
                 + k2Gk * krat * dQx_dy(test_re, tri_re, v, v, k, s)
                 + k2Gk * krat * Q(test_re, tri_re)
                 + k2Gk * dQx_dy(test_re, tri_re, w, v, k, s)
@@ -387,7 +486,7 @@ class NonLinearProblem:
 
             dFIm_dw = (
                 -Lre(test_im, tri_im)
-                + k**2 * Mre(test_im, tri_im)
+                + k2 * Mre(test_im, tri_im)
                 + k2Gk
                 * (
                     krat * (dQx_dy(test_im, tri_im, w, w, k, s) + Q(test_im, tri_im))
@@ -400,7 +499,7 @@ class NonLinearProblem:
                 Lim(test_re, tri_im)
                 + -k * R(test_re, tri_im)
                 - k * N(test_re, tri_im)
-                - k**2 * Mim(test_re, tri_im)
+                - k2 * Mim(test_re, tri_im)
                 + k2Gk
                 * (
                     krat * dQx_dy(test_re, tri_im, v, w, k, s)
@@ -413,7 +512,7 @@ class NonLinearProblem:
                 -Lim(test_im, tri_re)
                 + k * R(test_im, tri_re)
                 + k * N(test_im, tri_re)
-                + k**2 * Mim(test_im, tri_re)
+                + k2 * Mim(test_im, tri_re)
                 + k2Gk
                 * (
                     krat * dQx_dy(test_im, tri_re, w, v, k, s)
@@ -449,8 +548,8 @@ class NonLinearProblem:
             tri_re, tri_im = ufl.TrialFunction(Wre_col), ufl.TrialFunction(Wim_col)
             test_re, test_im = ufl.TestFunction(Wre_row), ufl.TestFunction(Wim_row)
 
-            krat = (k_row - ka) / gt
-            k2Gk = k_row**2 * Gk(k_row)
+            krat = krat_map[k_row]
+            k2Gk = k2Gk_map[k_row]
 
             col_v = (v_col, k_col, s_col)
             col_w = (w_col, k_col, s_col)
@@ -485,87 +584,58 @@ class NonLinearProblem:
             a_form_array[offy + 1, offx + 1] = dFIm_dw
 
         log.debug("create form array objects")
-        a_form_array = np.array(
-            [[None for _ in range(2 * nmodes)] for _ in range(2 * nmodes)], dtype=object
-        )
-        dF_dk_seq, dF_ds_seq = [], []
-        # product loop for filling the a_form_array with forms
-        for mode_row_index, (
-            (b_row, k_row, s_row),
-            (Wre_row, Wim_row),
-        ) in enumerate(zip(modes_data, spaces)):
-            calc_Fre_and_Fim(b_row, k_row, Wre_row, Wim_row)
-
-            for mode_col_index, (
-                (b_col, k_col, s_col),
-                (Wre_col, Wim_col),
-            ) in enumerate(zip(modes_data, spaces)):
-                if mode_row_index == mode_col_index:
-                    call_A_diag_block(
-                        mode_row_index, b_col, k_col, s_col, Wre_col, Wim_col
-                    )
-                else:
-                    call_A_offdiag_block(
-                        mode_row_index,
-                        mode_col_index,
-                        b_row,
-                        k_row,
-                        s_row,
-                        Wre_row,
-                        Wim_row,
-                        b_col,
-                        k_col,
-                        s_col,
-                        Wre_col,
-                        Wim_col,
-                    )
-
+        # all entries are filled by call_A_diag_block and call_A_offdiag_block
+        a_form_array = np.empty((2 * nmodes, 2 * nmodes), dtype=object)
         # column vectors (vec_F_petsc, vec_dF_ds_seq, vec_dF_dk_seq)
-        for mode_col_index, (
-            (b_col, k_col, s_col),
-            (Wre_col, Wim_col),
-        ) in enumerate(zip(modes_data, spaces)):
-            local_dF_dk_column, local_dF_ds_column = [], []
-            for mode_row_index, (
-                (b_row, k_row, s_row),
-                (Wre_row, Wim_row),
-            ) in enumerate(zip(modes_data, spaces)):
-                if mode_col_index == mode_row_index:
-                    calc_dF_dk_and_dF_ds(
-                        local_dF_dk_column,
-                        local_dF_ds_column,
-                        b_col,
-                        k_col,
-                        s_col,
-                        Wre_col,
-                        Wim_col,
-                    )
-                else:
-                    calc_dFx_dky_and_dFx_dsy(
-                        local_dF_dk_column,
-                        local_dF_ds_column,
-                        b_row,
-                        k_row,
-                        s_row,
-                        Wre_row,
-                        Wim_row,
-                        b_col,
-                        k_col,
-                        s_col,
-                        Wre_col,
-                        Wim_col,
-                    )
-
-            dF_dk_seq.append(local_dF_dk_column)
-            dF_ds_seq.append(local_dF_ds_column)
+        dF_dk_seq = [[None] * (2 * nmodes) for _ in range(nmodes)]
+        dF_ds_seq = [[None] * (2 * nmodes) for _ in range(nmodes)]
+
+        mode_items = list(enumerate(zip(modes_data, spaces)))
+        # diagonal blocks
+        for mode_index, ((b, k, s), (Wre, Wim)) in mode_items:
+            calc_Fre_and_Fim(mode_index, b, k, Wre, Wim)
+            call_A_diag_block(mode_index, b, k, s, Wre, Wim)
+            calc_dF_dk_and_dF_ds(
+                dF_dk_seq[mode_index],
+                dF_ds_seq[mode_index],
+                mode_index,
+                b,
+                k,
+                s,
+                Wre,
+                Wim,
+            )
+
+        # off-diagonal blocks (all pairs of modes with row index != col index)
+        for (mode_row_index, (row_data, row_spaces)), (
+            mode_col_index,
+            (col_data, col_spaces),
+        ) in itertools.permutations(mode_items, 2):
+            call_A_offdiag_block(
+                mode_row_index,
+                mode_col_index,
+                *row_data,
+                *row_spaces,
+                *col_data,
+                *col_spaces,
+            )
+            calc_dFx_dky_and_dFx_dsy(
+                dF_dk_seq[mode_col_index],
+                dF_ds_seq[mode_col_index],
+                mode_row_index,
+                *row_data,
+                *row_spaces,
+                *col_data,
+                *col_spaces,
+            )
 
         with Timer(log.debug, "Calling fem.form(F)"):
-            F_components = fem.form(F_components)
+            F_components = fem.form(F_components, jit_options=JIT_OPTIONS)
         with Timer(log.debug, "Calling fem.form(a)"):
-            a_form_array = fem.form(a_form_array)
+            a_form_array = fem.form(a_form_array, jit_options=JIT_OPTIONS)
         with Timer(log.debug, "Creating fem.form s for dF/dk dF/ds"):
-            dF_dk_seq = fem.form([x for x in dF_dk_seq])
-            dF_ds_seq = fem.form([x for x in dF_ds_seq])
+            dF_dk_seq = fem.form(dF_dk_seq, jit_options=JIT_OPTIONS)
+            dF_ds_seq = fem.form(dF_ds_seq, jit_options=JIT_OPTIONS)
         log.debug("create form array objects done")
 
         return F_components, a_form_array, dF_dk_seq, dF_ds_seq
@@ -582,10 +652,6 @@ class NonLinearProblem:
         # assemble F(minfos) into the vector L
         # assemble J(minfos) into the matrix A
 
-        # Reset the residual vector
-        with L.localForm() as L_local:
-            L_local.set(0.0)
-
         # N = A.getSize()[0]
         # assert N == A.getSize()[1]
         assert A.getSize()[0] == L.getSize()
@@ -593,41 +659,44 @@ class NonLinearProblem:
         n = self.n
 
         nmodes = len(minfos)
-        modes_data = []
-        for minfo, b, (k, s) in zip(minfos, self._b_vectors, self._form_constants):
+        for minfo, b, (k, s), k_constants in zip(
+            minfos, self._b_vectors, self._form_constants, self._k_constants
+        ):
             b.x.array[:] = minfo.cmplx_array
             k.value = complex(minfo.k, 0)
             s.value = complex(minfo.s, 0)
-            modes_data.append((b, k, s, minfo.dof_at_maximum))
+            self._update_k_constants(k_constants, minfo.k)
         del b, k, s
 
-        log.info(
-            f"eval F and J at k={[m.k for m in minfos]}, s={[m.s for m in minfos]}"
-        )
-
-        etbm1s = []
-
-        bcscalar = PETSc.ScalarType(0)
-        bcdofs_seq = [bc.dof_indices()[0] for bc in bcs]
-        # we have to add the same BC for the subspaces self.Ws, because this is required
-        # for the block_matrix_assembly
-        # TODO rename new_bcs to just bcs
-        new_bcs = [
-            fem.dirichletbc(bcscalar, bcdofs, W)
-            for bcdofs in bcdofs_seq
-            for spacetuple in self._max_spaces[:nmodes]
-            for W in spacetuple
-        ]
-
-        for b_row, _, _, dof_at_maximum in modes_data:
-            etbm1 = b_row.vector.getValue(dof_at_maximum) - 1
-            if abs(etbm1) > 1e-12:
-                log.debug(f"{etbm1=}")
-            etbm1s.extend([etbm1.real, etbm1.imag])
+        if log.isEnabledFor(logging.INFO):
+            log.info(
+                "eval F and J at k=%s, s=%s",
+                [m.k for m in minfos],
+                [m.s for m in minfos],
+            )
 
-        # TODO create this in __init__
+        # e^T b - 1 of all modes, where e is the unit vector at the dof of the
+        # maximum of the mode (evaluated directly from the arrays of the modeinfos)
+        etbm1_vec = (
+            np.array(
+                [
+                    complex(m.re_array[m.dof_at_maximum], m.im_array[m.dof_at_maximum])
+                    for m in minfos
+                ]
+            )
+            - 1
+        )
+        if abs(etbm1_vec).max() > 1e-12:
+            log.debug("etbm1_vec=%s", etbm1_vec)
+        etbm1s = np.empty(2 * nmodes, dtype=PETSc.RealType)
+        etbm1s[0::2] = etbm1_vec.real
+        etbm1s[1::2] = etbm1_vec.imag
+
+        # The compiled forms are cached per nmodes (see get_forms) and are passed
+        # as-is to the assemble_* functions below.
         F_components, a_form_array, dF_dk_seq, dF_ds_seq = self.get_forms(nmodes)
 
+        bcs = bcs or []
         try:
             matvec_coll = self.matvec_coll_map[nmodes]
         except KeyError:
@@ -643,61 +712,88 @@ class NonLinearProblem:
 
                 vec_dF_ds_seq = [create_vector_block(dF_ds) for dF_ds in dF_ds_seq]
                 log.debug("AFTER CVB (dF_ds_seq)")
+
                 matvec_coll = MatVecCollection(
                     mat_dF_dvw=mat_dF_dvw,
                     vec_F_petsc=vec_F_petsc,
                     vec_dF_dk_seq=vec_dF_dk_seq,
                     vec_dF_ds_seq=vec_dF_ds_seq,
+                    block_bcs=self._create_block_bcs(bcs, nmodes),
+                    bcs=bcs,
                 )
 
                 self.matvec_coll_map[nmodes] = matvec_coll
 
-        with matvec_coll.vec_F_petsc.localForm() as F_local:
-            F_local.set(0.0)
+        # The bcs usually don't change between Newton steps, hence the block bcs are
+        # only recreated if different bcs are passed.
+        if len(bcs) != len(matvec_coll.bcs) or any(
+            bc is not cached_bc for bc, cached_bc in zip(bcs, matvec_coll.bcs)
+        ):
+            matvec_coll = self.matvec_coll_map[nmodes] = matvec_coll._replace(
+                block_bcs=self._create_block_bcs(bcs, nmodes), bcs=bcs
+            )
+
+        block_bcs = matvec_coll.block_bcs
+
+        # assemble_vector_block adds into the (non-ghosted) vector
+        matvec_coll.vec_F_petsc.zeroEntries()
         fem.petsc.assemble_vector_block(
-            matvec_coll.vec_F_petsc, F_components, a_form_array, bcs=new_bcs
+            matvec_coll.vec_F_petsc,
+            F_components,
+            a_form_array,
+            bcs=block_bcs,
         )
 
         # log.debug(f"norm F_petsc {F_petsc.norm(0)}")
         # S b = L.sub(0)
         # e^T b - 1 = L.sub(1)
 
+        # L is a sequential vector, hence we can directly write into its array. Note
+        # that all the values of L are overwritten, i.e., L doesn't have to be reset.
         f_vals = matvec_coll.vec_F_petsc.getArray()
-        L.setValues(range(2 * nmodes * n), f_vals.real)
-        L.setValues(range(2 * nmodes * n, 2 * nmodes * (n + 1)), np.asarray(etbm1s))
+        L_arr = L.getArray(readonly=False)
+        L_arr[: 2 * nmodes * n] = f_vals.real
+        L_arr[2 * nmodes * n : 2 * nmodes * (n + 1)] = etbm1s
 
-        log.info(f"current norm of F: {L.norm(0)}")
+        if log.isEnabledFor(logging.INFO):
+            # the norm is only computed if it is actually logged
+            log.info("current norm of F: %s", L.norm(0))
 
         # 1 x n
 
         mat_dF_dvw = matvec_coll.mat_dF_dvw
-        with Timer(log.debug, f"ass bilinear forms {mat_dF_dvw.getSize()=}"):
-            mat_dF_dvw.zeroEntries()  # not sure if this is really needed
+        with Timer(log.debug, "ass bilinear forms"):
+            # assemble_matrix_block adds the values to the matrix, hence the values
+            # have to be reset (zeroEntries keeps the nonzero structure).
+            mat_dF_dvw.zeroEntries()
             fem.petsc.assemble_matrix_block(
                 mat_dF_dvw,
                 a_form_array,
-                bcs=new_bcs,
+                bcs=block_bcs,
             )
             mat_dF_dvw.assemble()
 
+        # Note that F and the dF/dk, dF/ds columns can't be assembled in a single
+        # assemble_vector_block call: The linear forms passed to assemble_vector_block
+        # have to match the block rows of a_form_array (2*nmodes blocks), i.e.,
+        # every column vector of the Jacobian requires its own block vector and
+        # hence its own call.
         with Timer(log.debug, "ass linear forms"):
             vec_dk_seq = matvec_coll.vec_dF_dk_seq
             vec_ds_seq = matvec_coll.vec_dF_ds_seq
-            for i, (dF_dk, dF_ds) in enumerate(zip(dF_dk_seq, dF_ds_seq)):
-                vec = vec_dk_seq[i]
-                with vec.localForm() as vec_local:
-                    vec_local.set(0.0)
-
+            # the Newton problem is serial, i.e., the vectors don't have ghost entries
+            # and zeroEntries resets all the values the assembly adds into.
+            for vec in itertools.chain(vec_dk_seq, vec_ds_seq):
+                vec.zeroEntries()
+
+            for vec_dk, vec_ds, dF_dk, dF_ds in zip(
+                vec_dk_seq, vec_ds_seq, dF_dk_seq, dF_ds_seq
+            ):
                 fem.petsc.assemble_vector_block(
-                    vec, fem.form(dF_dk), a_form_array, bcs=new_bcs
+                    vec_dk, dF_dk, a_form_array, bcs=block_bcs
                 )
-
-                vec = vec_ds_seq[i]
-                with vec.localForm() as vec_local:
-                    vec_local.set(0.0)
-
                 fem.petsc.assemble_vector_block(
-                    vec, fem.form(dF_ds), a_form_array, bcs=new_bcs
+                    vec_ds, dF_ds, a_form_array, bcs=block_bcs
                 )
 
         with Timer(log.debug, "Assembly of Jacobian into block real matrix"):
@@ -717,8 +813,29 @@ class NonLinearProblem:
                 nmodes=len(dF_dk_seq),
             )
 
+    def _create_block_bcs(self, bcs, nmodes):
+        # we have to add the same BC for the subspaces self.Ws, because this is
+        # required for the block_matrix_assembly.
+        if not bcs:
+            return []
+        # a single bc (containing the dofs of all bcs) per subspace
+        bcdofs = np.unique(np.concatenate([bc.dof_indices()[0] for bc in bcs]))
+        bcscalar = PETSc.ScalarType(0)
+        return [
+            fem.dirichletbc(bcscalar, bcdofs, W)
+            for W in itertools.chain.from_iterable(self._max_spaces[:nmodes])
+        ]
+
     def create_A(self, nmodes=1):
-        # A contains the jacobian
+        # A contains the jacobian. Note that the result is not cached, because every
+        # Newton solver needs its own matrix (see
+        # newtils.create_multimode_solvers_and_matrices).
+        A = self._create_A(nmodes)
+        # only the sparsity structure (and not the placeholder values) of A is needed
+        A.zeroEntries()
+        return A
+
+    def _create_A(self, nmodes):
         tstf = [ufl.TestFunction(W) for W in self.Ws]
         trif = [ufl.TrialFunction(W) for W in self.Ws]
 
@@ -726,14 +843,14 @@ class NonLinearProblem:
             [
                 [inner(trif[j], tstf[i]) * ufl.dx for j in range(2 * nmodes)]
                 for i in range(2 * nmodes)
-            ]
+            ],
+            jit_options=JIT_OPTIONS,
         )
 
         with Timer(log.debug, "create_A"):
+            # a newly created matrix doesn't contain any nonzero values
             block_mat = create_matrix_block(form_array)
 
-            block_mat.zeroEntries()  # not sure if this is really needed
-
             fem.petsc.assemble_matrix_block(
                 block_mat,
                 form_array,
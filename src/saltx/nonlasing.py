@@ -7,6 +7,7 @@ import logging
 import operator
 from typing import Any
 
+import numpy as np
 import ufl
 from dolfinx import fem
 from dolfinx.fem.petsc import create_matrix, create_vector
@@ -15,6 +16,7 @@ from petsc4py import PETSc
 from ufl import dx, elem_mult, inner, nabla_grad
 
 from . import jacobian
+from .assemble import JIT_OPTIONS
 from .log import Timer
 
 log = logging.getLogger(__name__)
@@ -29,8 +31,10 @@ def ass_linear_form_into_vec(vec, form, bcs):
     vec.assemble()
 
 
-def ass_bilinear_form(mat, form, bcs, diagonal):
-    mat.zeroEntries()  # not sure if this is really needed
+def ass_bilinear_form(mat, form, bcs, diagonal, finalize=True):
+    # needed, because assemble_matrix adds the cell contributions into the existing
+    # values (the sparsity pattern of mat is kept)
+    mat.zeroEntries()
 
     fem.petsc.assemble_matrix(
         mat,
@@ -38,7 +42,18 @@ def ass_bilinear_form(mat, form, bcs, diagonal):
         bcs=bcs,
         diagonal=diagonal,
     )
-    mat.assemble()
+    if finalize:
+        mat.assemble()
+    else:
+        # the caller has to call mat.assemblyEnd() before mat is used
+        mat.assemblyBegin()
+
+
+def _gammak(k: complex, ka: float, gt: float) -> tuple[complex, complex]:
+    """Return the gain curve gamma(k) and its derivative dgamma/dk."""
+    denom = k - ka + 1j * gt
+    gammak = gt / denom
+    return gammak, -gammak / denom
 
 
 class NonLasingLinearProblem:
@@ -70,8 +85,12 @@ class NonLasingLinearProblem:
         self.b = fem.Function(self.V)
 
         self.form_Sb: fem.forms.FormMetaClass
-        self.form_dFdk: fem.forms.FormMetaClass
-        self.form_dFdu: fem.forms.FormMetaClass
+        # bilinear forms of dF/du (see _assemble_dF_du)
+        self.form_L: fem.forms.FormMetaClass
+        self.form_M: fem.forms.FormMetaClass
+        self.form_Q: fem.forms.FormMetaClass
+        self.form_R: fem.forms.FormMetaClass | None
+        self.form_N: fem.forms.FormMetaClass | None
 
         self.ka = ka
         self.gt = gt
@@ -88,6 +107,13 @@ class NonLasingLinearProblem:
 
         self.bcs = bcs
         self.ds_obc = ds_obc
+        # the bcs are applied to the final dF/du matrix (see _assemble_dF_du)
+        if bcs:
+            self._bc_dofs = np.unique(
+                np.concatenate([bc.dof_indices()[0] for bc in bcs])
+            )
+        else:
+            self._bc_dofs = np.empty(0, dtype=PETSc.IntType)
 
         topo_dim = V.mesh.topology.dim
         self._mult = elem_mult if topo_dim > 1 else operator.mul
@@ -98,44 +124,102 @@ class NonLasingLinearProblem:
 
         # initialize PETSc vectors to avoid repeated allocation in every iteration of
         # the Newton method.
-        with Timer(print, "Create initial matrix/vectors for J & F"):
+        with Timer(log.debug, "Create initial matrix/vectors for J & F"):
             self.vec_F_petsc = create_vector(self.form_Sb)
-            self.mat_dF_du = create_matrix(self.form_dFdu)
-            self.vec_dF_dk = create_vector(self.form_dFdk)
+            # Note that the exterior facet integrals (R) don't couple additional dofs,
+            # i.e., all the matrices of dF/du are preallocated with the sparsity
+            # pattern of M.
+            self.mat_dF_du = create_matrix(self.form_M)
+            self.vec_dF_dk = self.vec_F_petsc.duplicate()
+            # work vectors for the matrix-vector products in _assemble_F_and_dF_dk
+            self._vec_Qb = self.vec_F_petsc.duplicate()
+            self._vec_tmp = self.vec_F_petsc.duplicate()
+
+    def _assemble_constant_matrices(self):
+        # Only Q depends on the pump, which can be changed (e.g., via a D0 constant)
+        # between calls of assemble_F_and_J. The matrices of the remaining bilinear
+        # forms don't change and are only assembled when the forms are (re)created.
+        self.mat_L = self._create_constant_matrix(self.form_L)
+        self.mat_M = self._create_constant_matrix(self.form_M)
+        self.mat_R = self._create_constant_matrix(self.form_R)
+        self.mat_N = self._create_constant_matrix(self.form_N)
+        # the final assembly of the matrices was only started in
+        # _create_constant_matrix
+        for mat in [self.mat_L, self.mat_M, self.mat_R, self.mat_N]:
+            if mat is not None:
+                mat.assemblyEnd()
+
+    def _create_constant_matrix(self, form):
+        if form is None:
+            return None
+        mat = create_matrix(self.form_M)
+        ass_bilinear_form(mat, form, bcs=[], diagonal=1.0, finalize=False)
+        return mat
+
+    def _assemble_dF_du(self, k: complex, gammak: complex) -> None:
+        # dF/du = -L + k**2 M + k**2 gammak Q + 1j k R + 1j k N (without bcs)
+
+        mat = self.mat_dF_du
+        ass_bilinear_form(mat, self.form_Q, bcs=[], diagonal=1.0)
+        # Q b is needed for dF/dk
+        mat.mult(self.b.vector, self._vec_Qb)
+        mat.scale(k**2 * gammak)
+        # The cell integrals (L, M, N) write all the entries of the preallocated
+        # sparsity pattern, whereas only the entries of the boundary dofs are written
+        # into R. The unused entries of R are removed by the final assembly, i.e.,
+        # the nonzero pattern of R is only a subset of the one of dF/du.
+        same = PETSc.Mat.Structure.SAME_NONZERO_PATTERN
+        subset = PETSc.Mat.Structure.SUBSET_NONZERO_PATTERN
+        for alpha, const_mat, structure in [
+            (-1.0, self.mat_L, same),
+            (k**2, self.mat_M, same),
+            (1j * k, self.mat_R, subset),
+            (1j * k, self.mat_N, same),
+        ]:
+            if const_mat is not None:
+                mat.axpy(alpha, const_mat, structure=structure)
+
+    def _assemble_F_and_dF_dk(
+        self, k: complex, gammak: complex, dgammak_dk: complex
+    ) -> None:
+        # All the bilinear forms are symmetric, hence the residual is
+        #   F = dF/du b
+        # and
+        #   dF/dk = (2k M + (2k gammak + k**2 dgammak_dk) Q + 1j R + 1j N) b,
+        # where dF/du (without bcs) and Q b were computed in _assemble_dF_du.
+        b_vec = self.b.vector
+        F_petsc = self.vec_F_petsc
+        self.mat_dF_du.mult(b_vec, F_petsc)
+
+        dF_dk = self.vec_dF_dk
+        self._vec_Qb.copy(dF_dk)
+        dF_dk.scale(2 * k * gammak + k**2 * dgammak_dk)
+        tmp = self._vec_tmp
+        for alpha, const_mat in [
+            (2 * k, self.mat_M),
+            (1j, self.mat_R),
+            (1j, self.mat_N),
+        ]:
+            if const_mat is not None:
+                const_mat.mult(b_vec, tmp)
+                dF_dk.axpy(alpha, tmp)
+
+        for vec in (F_petsc, dF_dk):
+            fem.set_bc(vec, self.bcs)
 
     def _demo_check_solutions(self, x: PETSc.Vec) -> None:
-        b = fem.Function(self.V)
-        b.x.array[:] = x.getValues(range(self.n))
-        k = fem.Constant(self.V.mesh, x.getValue(self.n))
+        # Only for debugging purposes (this is not called by the Newton solver).
+        # The cached form of the residual is used, i.e. b and k are updated in-place
+        # (as in assemble_F_and_J).
+        x_array = x.getArray(readonly=True)
+        self.b.x.array[:] = x_array[: self.n]
+        k = self.k_constant
+        k.value = x_array[self.n]
         print(f"eval F at k={k.value}")
 
-        pump = self.pump
-        dielec = self.dielec
-        invperm = self.invperm
-        ka = self.ka
-        gt = self.gt
-
-        curl = self._curl
-        mult = self._mult
-
-        gammak = gt / (k - ka + 1j * gt)
-
-        u = ufl.TrialFunction(self.V)
-        formL = inner(mult(invperm, curl(u)), curl(ufl.conj(b))) * dx
-        M = dielec * inner(u, ufl.conj(b)) * dx
-        Q = pump * inner(u, ufl.conj(b)) * dx
-
-        Sb = -formL + k**2 * M + k**2 * gammak * Q
-        if self.ds_obc is not None:
-            R = inner(u, ufl.conj(b)) * self.ds_obc
-            Sb += 1j * k * R
-        if self.sigma_c is not None:
-            N = self.sigma_c * inner(u, ufl.conj(b)) * dx
-            Sb += 1j * k * N
-
         F_petsc = self.vec_F_petsc
         with Timer(print, "ass linear form F"):
-            ass_linear_form_into_vec(F_petsc, fem.form(Sb), self.bcs)
+            ass_linear_form_into_vec(F_petsc, self.form_Sb, self.bcs)
         print(f"norm F_petsc {F_petsc.norm(0)}")
 
     def assemble_F_and_J(
@@ -144,120 +228,125 @@ class NonLasingLinearProblem:
         # assemble F(x) into the vector L
         # and J(x) into the matrix A
 
-        # Reset the residual vector
-        with L.localForm() as L_local:
-            L_local.set(0.0)
-
         assert self.n + 1 == L.getSize()
 
+        # x is a sequential vector, i.e., its array contains all the values
+        x_array = x.getArray(readonly=True)
         b = self.b
-        b.x.array[:] = x.getValues(range(self.n))
+        b.x.array[:] = x_array[: self.n]
         k = self.k_constant
-        k.value = x.getValue(self.n)
+        k.value = x_array[self.n]
 
-        print(f"eval F at k={k.value}")
+        log.debug("eval F at k=%s", k.value)
+
+        k_value = complex(k.value)
+        gammak, dgammak_dk = _gammak(k_value, self.ka, self.gt)
+
+        with Timer(log.debug, "ass bilinear form dF/du"):
+            self._assemble_dF_du(k_value, gammak)
 
         F_petsc = self.vec_F_petsc
-        with Timer(print, "ass linear form F"):
-            ass_linear_form_into_vec(F_petsc, self.form_Sb, self.bcs)
-        print(f"norm F_petsc {F_petsc.norm(0)}")
+        with Timer(log.debug, "calc F and dF/dk"):
+            self._assemble_F_and_dF_dk(k_value, gammak, dgammak_dk)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("norm F_petsc %s", F_petsc.norm(0))
 
-        etbm1 = b.vector.getValue(dof_at_maximum) - 1
+        # this is equivalent to the assembly of dF/du with bcs and diagonal=1.0
+        self.mat_dF_du.zeroRowsColumns(self._bc_dofs, diag=1.0)
+
+        # e^T is the indicator vector of dof_at_maximum, i.e., e^T b is a single entry
+        # of b
+        etbm1 = b.x.array[dof_at_maximum] - 1
         if abs(etbm1) > 1e-12:
-            print(f"{etbm1=}")
+            log.debug("etbm1=%s", etbm1)
 
         # S b = L.sub(0)
         # e^T b - 1 = L.sub(1)
 
-        L.setValues(range(self.n), F_petsc)
-        L.setValue(self.n, etbm1)
-
-        print(f"current norm of F: {L.norm(0)}")
+        # L is a sequential vector, hence all its values are (over)written via a view
+        # of its array (no reset and no assembly of L is needed)
+        L_array = L.getArray(readonly=False)
+        L_array[: self.n] = F_petsc.getArray(readonly=True)
+        L_array[self.n] = etbm1
 
-        with Timer(print, "ass bilinear form dF/du"):
-            ass_bilinear_form(
-                self.mat_dF_du, self.form_dFdu, bcs=self.bcs, diagonal=1.0
-            )
-
-        with Timer(print, "ass linear form dF/dk"):
-            ass_linear_form_into_vec(self.vec_dF_dk, self.form_dFdk, self.bcs)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("current norm of F: %s", L.norm(0))
 
         jacobian.assemble_complex_singlemode_jacobian_matrix(
             A, self.mat_dF_du, self.vec_dF_dk, dof_at_maximum
         )
 
-    def create_forms(self):
-        pump = self.pump
-        dielec = self.dielec
-        invperm = self.invperm
-        ka = self.ka
-        gt = self.gt
+    def _create_ufl_forms(self, u, v):
+        """Return the bilinear UFL forms L, M, Q, R and N of dF/du.
 
+        R and N are None if there are no open boundary conditions or no
+        conductivity, respectively.
+        """
         curl = self._curl
-        mult = self._mult
+        L = inner(self._mult(self.invperm, curl(u)), curl(v)) * dx
+        M = self.dielec * inner(u, v) * dx
+        Q = self.pump * inner(u, v) * dx
+        R = None
+        if self.ds_obc is not None:
+            R = inner(u, v) * self.ds_obc
+        N = None
+        if self.sigma_c is not None:
+            N = self.sigma_c * inner(u, v) * dx
+        return L, M, Q, R, N
 
-        b = self.b
+    def create_forms(self):
         k = self.k_constant
-
-        gammak = gt / (k - ka + 1j * gt)
+        gammak = self.gt / (k - self.ka + 1j * self.gt)
 
         u = ufl.TrialFunction(self.V)
-        formL = inner(mult(invperm, curl(u)), curl(ufl.conj(b))) * dx
-        M = dielec * inner(u, ufl.conj(b)) * dx
-        Q = pump * inner(u, ufl.conj(b)) * dx
-
-        Sb = -formL + k**2 * M + k**2 * gammak * Q
-        if self.ds_obc is not None:
-            R = inner(u, ufl.conj(b)) * self.ds_obc
-            Sb += 1j * k * R
-        if self.sigma_c is not None:
-            N = self.sigma_c * inner(u, ufl.conj(b)) * dx
-            Sb += 1j * k * N
-        with Timer(print, "fem.form(Sb)"):
-            self.form_Sb = fem.form(Sb)
-
         v = ufl.TestFunction(self.V)
+        formL, M, Q, R, N = self._create_ufl_forms(u, v)
 
-        L = inner(mult(invperm, curl(u)), curl(ufl.conj(b))) * dx
-        M = dielec * inner(u, ufl.conj(b)) * dx
-        Q = pump * inner(u, ufl.conj(b)) * dx
-
-        # Sb = -L + 1j * k * R + k**2 * M + 1j * k * N + k**2 * gammak * Q
-        dgammak_dk = -gt / (k - ka + 1j * gt) ** 2
-
-        dFdk = 2 * k * M + 2 * k * gammak * Q + k**2 * dgammak_dk * Q
-        if self.ds_obc is not None:
-            R = inner(u, ufl.conj(b)) * self.ds_obc
-            dFdk += 1j * R
-        if self.sigma_c is not None:
-            N = self.sigma_c * inner(u, ufl.conj(b)) * dx
-            dFdk += 1j * N
-
-        L = inner(mult(invperm, curl(u)), curl(v)) * dx
-        M = dielec * inner(u, v) * dx
-        Q = pump * inner(u, v) * dx
-
-        dFdu = -L + k**2 * M + k**2 * gammak * Q
-        if self.ds_obc is not None:
-            R = inner(u, v) * self.ds_obc
+        dFdu = -formL + k**2 * M + k**2 * gammak * Q
+        if R is not None:
             dFdu += 1j * k * R
-        if self.sigma_c is not None:
-            N = self.sigma_c * inner(u, v) * dx
+        if N is not None:
             dFdu += 1j * k * N
-
-        self.form_dFdk = fem.form(dFdk)
-        self.form_dFdu = fem.form(dFdu)
+        # Note that this form is only used in _demo_check_solutions (assemble_F_and_J
+        # computes F via matrix-vector products)
+        with Timer(log.debug, "fem.form(Sb)"):
+            self.form_Sb = fem.form(ufl.action(dFdu, self.b), jit_options=JIT_OPTIONS)
+
+        # dF/du = -L + k**2 * M + k**2 * gammak * Q + 1j * k * R + 1j * k * N is
+        # assembled from the matrices of the individual bilinear forms
+        self.form_L = fem.form(formL, jit_options=JIT_OPTIONS)
+        self.form_M = fem.form(M, jit_options=JIT_OPTIONS)
+        self.form_Q = fem.form(Q, jit_options=JIT_OPTIONS)
+        self.form_R = None if R is None else fem.form(R, jit_options=JIT_OPTIONS)
+        self.form_N = None if N is None else fem.form(N, jit_options=JIT_OPTIONS)
+
+        # Note that create_forms has to be called again, when e.g. sigma_c is changed
+        # after the initialization.
+        with Timer(log.debug, "Assemble the pump-independent matrices of dF/du"):
+            self._assemble_constant_matrices()
 
     def create_A(self, n_fem):
-        A = PETSc.Mat().create(MPI.COMM_WORLD)
+        # Note that the result is not cached, because every Newton solver needs its
+        # own matrix.
+        assert n_fem == self.n
         N = n_fem + 1
-        A.setSizes([N, N])
-        A.setUp()
-        return A
+        # The sparsity pattern of A is the one of dF/du plus the column vector dF/dk
+        # and the last row, which contains e^T and the diagonal entry (see
+        # jacobian.assemble_complex_singlemode_jacobian_matrix).
+        # Note that mat_dF_du may not be assembled yet, but mat_M (assembled in
+        # __init__) has the same sparsity pattern.
+        rows_ind, _, _ = self.mat_M.getValuesCSR()
+        nnz = np.empty(N, dtype=PETSc.IntType)
+        nnz[:-1] = np.diff(rows_ind) + 1
+        nnz[-1] = 2
+        return PETSc.Mat().createAIJ([N, N], nnz=nnz, comm=MPI.COMM_WORLD)
 
     def create_L(self, n_fem):
         return PETSc.Vec().createSeq(n_fem + 1)
 
     def create_dx(self, n_fem):
+        # Note that the result is not cached, because two different vectors are
+        # needed by the Newton solver (the solution and the correction).
+
         # n_fem (complex-valued) entries for b, 1 for k
         return PETSc.Vec().createSeq(n_fem + 1)
@@ -17,7 +17,6 @@ import numpy as np
 import pytest
 import ufl
 from dolfinx import fem, mesh
-from dolfinx.fem.petsc import create_matrix
 from dolfinx.mesh import locate_entities_boundary, meshtags
 from mpi4py import MPI
 from petsc4py import PETSc
@@ -51,20 +50,57 @@ def determine_meshtags_for_1d(msh):
         return np.isclose(x[0], 1.0)
 
     left_facets = locate_entities_boundary(msh, msh.topology.dim - 1, left)
-    left_vals = np.full(left_facets.shape, 1, np.intc)
-
     right_facets = locate_entities_boundary(msh, msh.topology.dim - 1, right)
-    right_vals = np.full(right_facets.shape, 2, np.intc)
 
-    indices = np.hstack((left_facets, right_facets))
-    values = np.hstack((left_vals, right_vals))
+    # the left and the right facets of the interval are distinct, hence it is
+    # sufficient to sort the (at most two) indices
+    indices = np.concatenate((left_facets, right_facets))
+    values = np.repeat(
+        np.array([1, 2], dtype=np.intc), (left_facets.size, right_facets.size)
+    )
+
+    order = np.argsort(indices)
+    return meshtags(msh, msh.topology.dim - 1, indices[order], values[order])
 
-    indices, pos = np.unique(indices, return_index=True)
-    return meshtags(msh, msh.topology.dim - 1, indices, values[pos])
+
+@pytest.fixture(scope="module")
+def interval_space_factory():
+    """Return a function that provides the mesh, the function space and the
+    evaluator of the interval.
+
+    These objects don't depend on the boundary conditions, i.e., they are only
+    created once per module for the single and the double size interval.
+    """
+    cache = {}
+
+    def get_interval_space(double_size: bool):
+        try:
+            return cache[double_size]
+        except KeyError:
+            pass
+
+        if double_size:
+            msh = mesh.create_interval(MPI.COMM_WORLD, points=(-1, 1), nx=1000)
+        else:
+            msh = mesh.create_unit_interval(MPI.COMM_WORLD, nx=1000)
+
+        V = fem.FunctionSpace(msh, ("Lagrange", 3))
+
+        evaluator = algorithms.Evaluator(
+            V,
+            msh,
+            # we only care about the mode intensity at the left and right
+            # (double_size=True) or only at the right lead (double_size=False).
+            np.array([-1.0, 1.0] if double_size else [1.0]),
+        )
+        cache[double_size] = msh, V, evaluator
+        return cache[double_size]
+
+    return get_interval_space
 
 
 @pytest.fixture
-def system(bc_type):
+def system(bc_type, interval_space_factory):
     dielec = 1.2**2
     pump_profile = 1.0
     ka = 10.0
@@ -80,20 +116,7 @@ def system(bc_type):
     del vscale
 
     double_size = bc_type == BCType.NONE
-    if double_size:
-        msh = mesh.create_interval(MPI.COMM_WORLD, points=(-1, 1), nx=1000)
-    else:
-        msh = mesh.create_unit_interval(MPI.COMM_WORLD, nx=1000)
-
-    V = fem.FunctionSpace(msh, ("Lagrange", 3))
-
-    evaluator = algorithms.Evaluator(
-        V,
-        msh,
-        # we only care about the mode intensity at the left and right
-        # (double_size=True) or only at the right lead (double_size=False).
-        np.array([-1.0, 1.0] if double_size else [1.0]),
-    )
+    msh, V, evaluator = interval_space_factory(double_size)
 
     ds_obc = ufl.ds
     if double_size:
@@ -112,11 +135,13 @@ def system(bc_type):
 
         ds_obc = ds(2)  # at the right lead we impose OBC
     else:
-        # Define Dirichlet boundary condition on the left
-        bcs_dofs = fem.locate_dofs_geometrical(
-            V,
-            lambda x: np.isclose(x[0], 0.0),
+        # Define Dirichlet boundary condition on the left (only the boundary facets
+        # are checked, not the coordinates of all the dofs)
+        fdim = msh.topology.dim - 1
+        left_facets = locate_entities_boundary(
+            msh, fdim, lambda x: np.isclose(x[0], 0.0)
         )
+        bcs_dofs = fem.locate_dofs_topological(V, fdim, left_facets)
 
         Print(f"{bcs_dofs=}")
         bcs = [
@@ -125,13 +150,21 @@ def system(bc_type):
 
     n = V.dofmap.index_map.size_global
 
+    # the pump-independent matrices of the NEVP
+    u = ufl.TrialFunction(V)
+    v = ufl.TestFunction(V)
+    L = assemble_form(-inner(nabla_grad(u), nabla_grad(v)) * dx, bcs)
+    M = assemble_form(dielec * inner(u, v) * dx, bcs, diag=0.0)
+    R = assemble_form(inner(u, v) * ds_obc, bcs, diag=0.0)
+    del u, v
+
     fixture_locals = locals()
     return namedtuple("System", list(fixture_locals.keys()))(**fixture_locals)
 
 
 @pytest.mark.parametrize("bc_type", [BCType.DBC])
 @pytest.mark.parametrize("first_threshold", [True, False])
-def test_eval_traj(bc_type, system, first_threshold):
+def test_eval_traj(bc_type, system, first_threshold, hide_plots):
     """Plot the eigenvalues as a function of D0."""
     refine_first_mode = True
     if first_threshold:
@@ -152,20 +185,17 @@ def test_eval_traj(bc_type, system, first_threshold):
     D0_constant = real_const(system.V, 1.0)
 
     log.info("Before first assembly")
-    L = assemble_form(-inner(nabla_grad(u), nabla_grad(v)) * dx, system.bcs)
-    M = assemble_form(system.dielec * inner(u, v) * dx, system.bcs, diag=0.0)
-    R = assemble_form(inner(u, v) * system.ds_obc, system.bcs, diag=0.0)
-    Q_form = fem.form(D0_constant * system.pump_profile * inner(u, v) * dx)
-    Q = create_matrix(Q_form)
+    Q_unit = assemble_form(system.pump_profile * inner(u, v) * dx, system.bcs, diag=0.0)
+    Q = Q_unit.duplicate(copy=True)
     nevp_inputs = algorithms.NEVPInputs(
         ka=system.ka,
         gt=system.gt,
         rg_params=system.rg_params,
-        L=L,
-        M=M,
+        L=system.L,
+        M=system.M,
         N=None,
         Q=Q,
-        R=R,
+        R=system.R,
         bcs=system.bcs,
     )
 
@@ -188,7 +218,7 @@ def test_eval_traj(bc_type, system, first_threshold):
     for D0 in D0range:
         log.info(f" {D0=} ".center(80, "#"))
         D0_constant.value = D0
-        assemble_form(Q_form, system.bcs, diag=0.0, mat=nevp_inputs.Q)
+        algorithms.set_pump_matrix(nevp_inputs.Q, Q_unit, D0)
 
         modes = algorithms.get_nevp_modes(nevp_inputs)
         evals = np.asarray([mode.k for mode in modes])
@@ -229,22 +259,16 @@ def test_eval_traj(bc_type, system, first_threshold):
 
             sht_modes = algorithms.get_nevp_modes(nevp_inputs)
 
-            imag_evals = np.asarray([m.k.imag for m in sht_modes])
-            number_of_modes_close_to_real_axis = np.sum(np.abs(imag_evals) < 1e-10)
-            Print(
-                "Number of modes close to real axis: "
-                f"{number_of_modes_close_to_real_axis}"
-            )
+            sht_evals = np.asarray([m.k for m in sht_modes])
+            imag_evals = sht_evals.imag
+            (
+                number_of_modes_close_to_real_axis,
+                number_of_modes_above_real_axis,
+            ) = algorithms.count_modes_around_real_axis(imag_evals)
             assert number_of_modes_close_to_real_axis == 1
 
-            number_of_modes_above_real_axis = np.sum(imag_evals > 1e-10)
-            Print(f"Number of modes above real axis: {number_of_modes_above_real_axis}")
-
-            sht_evals = np.asarray([m.k for m in sht_modes])
-            vals_after_refine.append(
-                np.vstack([D0 * np.ones(sht_evals.shape), sht_evals]).T
-            )
-        vals.append(np.vstack([D0 * np.ones(evals.shape), evals]).T)
+            vals_after_refine.append(algorithms.stack_D0_and_evals(D0, sht_evals))
+        vals.append(algorithms.stack_D0_and_evals(D0, evals))
 
     if first_threshold:
         # see caption of Fig 1 of esterhazy paper
@@ -253,6 +277,9 @@ def test_eval_traj(bc_type, system, first_threshold):
         assert vals[-4][modeidx, 1].real == pytest.approx(11.533018)
         assert abs(vals[-4][modeidx, 1].imag) < 3e-4
 
+    if hide_plots:
+        return
+
     def scatter_plot(vals, title):
         fig, ax = plt.subplots()
         fig.suptitle(title)
@@ -303,22 +330,19 @@ def test_solve(D0, bc_type, system):
     v = ufl.TestFunction(system.V)
     D0_constant = real_const(system.V, D0)
 
-    L = assemble_form(-inner(nabla_grad(u), nabla_grad(v)) * dx, system.bcs)
-    M = assemble_form(system.dielec * inner(u, v) * dx, system.bcs, diag=0.0)
     Q = assemble_form(
         D0_constant * system.pump_profile * inner(u, v) * dx, system.bcs, diag=0.0
     )
-    R = assemble_form(inner(u, v) * system.ds_obc, system.bcs, diag=0.0)
 
     nevp_inputs = algorithms.NEVPInputs(
         ka=system.ka,
         gt=system.gt,
         rg_params=system.rg_params,
-        L=L,
-        M=M,
+        L=system.L,
+        M=system.M,
         N=None,
         Q=Q,
-        R=R,
+        R=system.R,
         bcs=system.bcs,
     )
     modes = algorithms.get_nevp_modes(nevp_inputs)
@@ -343,7 +367,7 @@ def test_solve(D0, bc_type, system):
         else:
             # according to the esterhazy paper there are 8 ev above the
             # threshold at D0=1.0, see figure 2
-            assert np.sum(evals.imag > 0) == 8
+            assert np.count_nonzero(evals.imag > 0) == 8
             modeselectors = range(1, 9)
     elif D0 == 0.3:
         if system.double_size:
@@ -351,7 +375,7 @@ def test_solve(D0, bc_type, system):
         else:
             modeselectors = [3, 4]
     else:
-        modeselectors = np.argwhere(evals.imag > 0).flatten()
+        modeselectors = np.flatnonzero(evals.imag > 0)
 
     for modesel in modeselectors:
         mode = modes[modesel]
@@ -382,7 +406,7 @@ def test_solve(D0, bc_type, system):
 
         if refined_mode.converged:
             mode_values = system.evaluator(refined_mode)
-            mode_intensity = abs(mode_values) ** 2
+            mode_intensity = mode_values.real**2 + mode_values.imag**2
             Print(f"-> {mode_intensity=}")
 
         if D0 == 1.0:
@@ -404,16 +428,12 @@ def test_solve(D0, bc_type, system):
             sht_modes = algorithms.get_nevp_modes(nevp_inputs)
 
             imag_evals = np.asarray([m.k.imag for m in sht_modes])
-            number_of_modes_close_to_real_axis = np.sum(np.abs(imag_evals) < 1e-10)
-            Print(
-                "Number of modes close to real axis: "
-                f"{number_of_modes_close_to_real_axis}"
-            )
+            (
+                number_of_modes_close_to_real_axis,
+                number_of_modes_above_real_axis,
+            ) = algorithms.count_modes_around_real_axis(imag_evals)
             assert number_of_modes_close_to_real_axis == 1
 
-            number_of_modes_above_real_axis = np.sum(imag_evals > 1e-10)
-            Print(f"Number of modes above real axis: {number_of_modes_above_real_axis}")
-
             if D0 == 0.37:
                 # at D0=0.37 (below 2nd mode turns on to lase) we only have a single
                 # mode at k ~ 11.46 (refining the other modes and inserting them
@@ -508,22 +528,19 @@ def test_multimode_solve(D0, bc_type, system):
 
     D0_constant = real_const(system.V, D0)
 
-    L = assemble_form(-inner(nabla_grad(u), nabla_grad(v)) * dx, system.bcs)
-    M = assemble_form(system.dielec * inner(u, v) * dx, system.bcs, diag=0.0)
     Q = assemble_form(
         D0_constant * system.pump_profile * inner(u, v) * dx, system.bcs, diag=0.0
     )
-    R = assemble_form(inner(u, v) * system.ds_obc, system.bcs, diag=0.0)
 
     nevp_inputs = algorithms.NEVPInputs(
         ka=system.ka,
         gt=system.gt,
         rg_params=system.rg_params,
-        L=L,
-        M=M,
+        L=system.L,
+        M=system.M,
         N=None,
         Q=Q,
-        R=R,
+        R=system.R,
         bcs=system.bcs,
     )
     modes = algorithms.get_nevp_modes(
@@ -584,19 +601,16 @@ def test_multimode_solve(D0, bc_type, system):
         "NBCsinglemoes",
     ],
 )
-def test_intensity_vs_pump_esterhazy(bc_type, D0range, system):
+def test_intensity_vs_pump_esterhazy(bc_type, D0range, system, hide_plots):
     u = ufl.TrialFunction(system.V)
     v = ufl.TestFunction(system.V)
 
     D0_constant = real_const(system.V, 1.0)
 
-    L = assemble_form(-inner(nabla_grad(u), nabla_grad(v)) * dx, system.bcs)
-    M = assemble_form(system.dielec * inner(u, v) * dx, system.bcs, diag=0.0)
-    Q = assemble_form(
-        D0_constant * system.pump_profile * inner(u, v) * dx, system.bcs, diag=0.0
-    )
-    R = assemble_form(inner(u, v) * system.ds_obc, system.bcs, diag=0.0)
+    Q_unit = assemble_form(system.pump_profile * inner(u, v) * dx, system.bcs, diag=0.0)
+    Q = Q_unit.duplicate(copy=True)
 
+    L = system.L
     Print(
         f"(complex-valued) NEVP: {L.getSize()=},  DOF: {L.getInfo()['nz_used']}, "
         f"MEM: {L.getInfo()['memory']}"
@@ -607,10 +621,10 @@ def test_intensity_vs_pump_esterhazy(bc_type, D0range, system):
         gt=system.gt,
         rg_params=system.rg_params,
         L=L,
-        M=M,
+        M=system.M,
         N=None,
         Q=Q,
-        R=R,
+        R=system.R,
         bcs=system.bcs,
     )
 
@@ -635,12 +649,7 @@ def test_intensity_vs_pump_esterhazy(bc_type, D0range, system):
     for D0 in D0range:
         Print(f" {D0=} ".center(80, "#"))
         D0_constant.value = D0
-        assemble_form(
-            D0_constant * system.pump_profile * inner(u, v) * dx,
-            system.bcs,
-            diag=0.0,
-            mat=nevp_inputs.Q,
-        )
+        algorithms.set_pump_matrix(nevp_inputs.Q, Q_unit, D0)
         modes = algorithms.get_nevp_modes(nevp_inputs)
         evals = np.asarray([mode.k for mode in modes])
         assert evals.size
@@ -685,16 +694,12 @@ def test_intensity_vs_pump_esterhazy(bc_type, D0range, system):
             sht_modes = algorithms.get_nevp_modes(nevp_inputs)
 
             imag_evals = np.asarray([m.k.imag for m in sht_modes])
-            number_of_modes_close_to_real_axis = np.sum(np.abs(imag_evals) < 1e-10)
-            Print(
-                "Number of modes close to real axis: "
-                f"{number_of_modes_close_to_real_axis}"
-            )
+            (
+                number_of_modes_close_to_real_axis,
+                number_of_modes_above_real_axis,
+            ) = algorithms.count_modes_around_real_axis(imag_evals)
             assert number_of_modes_close_to_real_axis == 1
 
-            number_of_modes_above_real_axis = np.sum(imag_evals > 1e-10)
-            Print(f"Number of modes above real axis: {number_of_modes_above_real_axis}")
-
             if number_of_modes_above_real_axis > 0:
                 second_mode = sht_modes[imag_evals.argmax()]
                 assert second_mode.k.imag > 1e-10
@@ -741,19 +746,24 @@ def test_intensity_vs_pump_esterhazy(bc_type, D0range, system):
                 newton_operators,
             )
             multi_evals = np.asarray([mode.k for mode in multi_modes])
-            number_of_modes_close_to_real_axis = np.sum(
+            number_of_modes_close_to_real_axis = np.count_nonzero(
                 np.abs(multi_evals.imag) < 1e-10
             )
             # if number_of_modes_close_to_real_axis > 1:
             #     breakpoint()
 
-        for mode in multi_modes:
-            mode_values = system.evaluator(mode)
-            mode_intensity = abs(mode_values) ** 2
+        if not multi_modes:
+            continue
+        # all modes are evaluated at once (one row per mode)
+        mode_values = system.evaluator(np.stack([mode.array for mode in multi_modes]))
+        for mode_intensity in mode_values.real**2 + mode_values.imag**2:
             Print(f"-> {mode_intensity=}")
             results.append((D0, mode_intensity))
             aevals.append(evals)
 
+    if hide_plots:
+        return
+
     fig, ax = plt.subplots()
     ax.plot(
         [D0 for (D0, _) in results],
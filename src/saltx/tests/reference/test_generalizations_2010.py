@@ -18,9 +18,9 @@ import numpy as np
 import pytest
 import ufl
 from dolfinx import fem
-from dolfinx.fem.petsc import create_matrix
+from dolfinx.mesh import meshtags
 from petsc4py import PETSc
-from ufl import ds, dx, inner, nabla_grad
+from ufl import dx, inner, nabla_grad
 
 from saltx import algorithms, newtils
 from saltx.assemble import assemble_form
@@ -59,7 +59,7 @@ def real_const(V, real_value: float) -> fem.Constant:
     return fem.Constant(V.mesh, complex(real_value, 0))
 
 
-@pytest.fixture
+@pytest.fixture(scope="module")
 def system():
     use_pml = False
     domains = [
@@ -104,11 +104,7 @@ def system():
     del vscale
 
     def cset(func, cells, value):
-        func.x.array[cells] = np.full_like(
-            cells,
-            value,
-            dtype=PETSc.ScalarType,
-        )
+        func.x.array[cells] = value
 
     cells = dcells[2 if use_pml else 0]
     cset(dielec, cells, 1.5**2)
@@ -133,6 +129,21 @@ def system():
             cset(invperm, cells, 1)
             cset(pump_profile, cells, 0.0)
 
+    # The pump profile is zero outside of the pumped cells, therefore the D0 dependent
+    # NEVP matrix is only integrated over the pumped cells (dx_pump only restricts the
+    # integration domain, the pump profile is still part of the integrand).
+    pump_tag = 1
+    pumped_cells = np.sort(
+        np.concatenate([dcells[2], dcells[3]] if use_pml else [dcells[0], dcells[1]])
+    )
+    pump_marker = meshtags(
+        msh,
+        msh.topology.dim,
+        pumped_cells,
+        np.full_like(pumped_cells, pump_tag, dtype=np.int32),
+    )
+    dx_pump = ufl.Measure("dx", subdomain_data=pump_marker, domain=msh)(pump_tag)
+
     V = fem.FunctionSpace(msh, ("Lagrange", 3))
 
     evaluator = algorithms.Evaluator(
@@ -166,13 +177,49 @@ def system():
 
     n = V.dofmap.index_map.size_global
 
+    # the pump-independent matrices of the NEVP
+    u = ufl.TrialFunction(V)
+    v = ufl.TestFunction(V)
+    L = assemble_form(-invperm * inner(nabla_grad(u), nabla_grad(v)) * dx, bcs)
+    # all the cell integrals have the same sparsity pattern as L, therefore the
+    # sparsity pattern of L is reused for M and (in the tests) for Q.
+    M = assemble_form(dielec * inner(u, v) * dx, bcs, diag=0.0, mat=L.duplicate())
+    R = assemble_form(inner(u, v) * ds_obc, bcs, diag=0.0)
+    del u, v
+
     fixture_locals = locals()
     return namedtuple("System", list(fixture_locals.keys()))(**fixture_locals)
 
 
+@pytest.fixture
+def nonlinear_problem(system):
+    """The nonlinear problem and its newton operators.
+
+    In contrast to the system fixture, this fixture is function-scoped,
+    because the tests change the pump strength (via D0_constant) and the
+    hole burning state of the nonlinear problem.
+    """
+    D0_constant = real_const(system.V, 1.0)
+    nlp = NonLinearProblem(
+        system.V,
+        system.ka,
+        system.gt,
+        dielec=system.dielec,
+        n=system.n,
+        pump=D0_constant * system.pump_profile,
+        ds_obc=system.ds_obc,
+    )
+    newton_operators = newtils.create_multimode_solvers_and_matrices(nlp, max_nmodes=2)
+
+    fixture_locals = locals()
+    return namedtuple("NonLinearProblemFixture", list(fixture_locals.keys()))(
+        **fixture_locals
+    )
+
+
 def plot_mode(system, mode):
     fine_mode_values = system.fine_evaluator(mode)
-    fine_mode_intensity = abs(fine_mode_values) ** 2
+    fine_mode_intensity = fine_mode_values.real**2 + fine_mode_values.imag**2
     _, ax = plt.subplots()
     ax.plot(
         system.fine_evaluator.points,
@@ -191,7 +238,7 @@ def plot_mode(system, mode):
     plt.show()
 
 
-def test_eval_traj(system):
+def test_eval_traj(system, hide_plots):
     """Plot the eigenvalues as a function of D0."""
     if False:
         from saltx.plot import plot_meshfunctions
@@ -208,25 +255,24 @@ def test_eval_traj(system):
 
     D0_constant = real_const(system.V, 1.0)
 
-    L = assemble_form(
-        -system.invperm * inner(nabla_grad(u), nabla_grad(v)) * dx, system.bcs
-    )
-    M = assemble_form(system.dielec * inner(u, v) * dx, system.bcs, diag=0.0)
     with Timer(log.error, "assemble Q form"):
-        Q_form = fem.form(D0_constant * system.pump_profile * inner(u, v) * dx)
-    Q = create_matrix(Q_form)  # we assemble it later
-    # Q = assemble_form(Q_form, system.bcs, diag=0.0)
-    R = assemble_form(inner(u, v) * ds, system.bcs, diag=0.0)
+        Q_unit = assemble_form(
+            system.pump_profile * inner(u, v) * system.dx_pump,
+            system.bcs,
+            diag=0.0,
+            mat=system.L.duplicate(),
+        )
+    Q = Q_unit.duplicate()  # the values are set in the D0 loop
 
     nevp_inputs = algorithms.NEVPInputs(
         ka=system.ka,
         gt=system.gt,
         rg_params=system.rg_params,
-        L=L,
-        M=M,
+        L=system.L,
+        M=system.M,
         N=None,
         Q=Q,
-        R=R,
+        R=system.R,
         bcs=system.bcs,
     )
 
@@ -251,7 +297,7 @@ def test_eval_traj(system):
     # for D0 in np.linspace(1.0, 1.6, 10):
     for D0 in D0range:
         D0_constant.value = D0
-        assemble_form(Q_form, system.bcs, diag=0.0, mat=Q)
+        algorithms.set_pump_matrix(Q, Q_unit, D0)
 
         modes = algorithms.get_nevp_modes(nevp_inputs)
         evals = np.asarray([mode.k for mode in modes])
@@ -297,22 +343,19 @@ def test_eval_traj(system):
             )
             sht_modes = algorithms.get_nevp_modes(nevp_inputs)
 
-            imag_evals = np.asarray([m.k.imag for m in sht_modes])
-            number_of_modes_close_to_real_axis = np.sum(np.abs(imag_evals) < 1e-10)
-            Print(
-                "Number of modes close to real axis: "
-                f"{number_of_modes_close_to_real_axis}"
-            )
+            sht_evals = np.asarray([m.k for m in sht_modes])
+            imag_evals = sht_evals.imag
+            (
+                number_of_modes_close_to_real_axis,
+                number_of_modes_above_real_axis,
+            ) = algorithms.count_modes_around_real_axis(imag_evals)
             assert number_of_modes_close_to_real_axis == 1
 
-            number_of_modes_above_real_axis = np.sum(imag_evals > 1e-10)
-            Print(f"Number of modes above real axis: {number_of_modes_above_real_axis}")
+            vals_after_refine.append(algorithms.stack_D0_and_evals(D0, sht_evals))
+        vals.append(algorithms.stack_D0_and_evals(D0, evals))
 
-            sht_evals = np.asarray([m.k for m in sht_modes])
-            vals_after_refine.append(
-                np.vstack([D0 * np.ones(sht_evals.shape), sht_evals]).T
-            )
-        vals.append(np.vstack([D0 * np.ones(evals.shape), evals]).T)
+    if hide_plots:
+        return
 
     def scatter_plot(vals, title):
         fig, ax = plt.subplots()
@@ -367,21 +410,18 @@ def test_eval_traj(system):
         # 1.13,  # 6 non-interacting modes
     ],
 )
-def test_solve(D0, system):
+def test_solve(D0, system, nonlinear_problem):
     u = ufl.TrialFunction(system.V)
     v = ufl.TestFunction(system.V)
 
-    L = assemble_form(
-        -system.invperm * inner(nabla_grad(u), nabla_grad(v)) * dx, system.bcs
-    )
-    M = assemble_form(system.dielec * inner(u, v) * dx, system.bcs, diag=0.0)
     Q = assemble_form(
-        real_const(system.V, D0) * system.pump_profile * inner(u, v) * dx,
+        real_const(system.V, D0) * system.pump_profile * inner(u, v) * system.dx_pump,
         system.bcs,
         diag=0.0,
+        mat=system.L.duplicate(),
     )
-    R = assemble_form(inner(u, v) * ds, system.bcs, diag=0.0)
 
+    L = system.L
     Print(
         f"{L.getSize()=},  DOF: {L.getInfo()['nz_used']}, MEM: {L.getInfo()['memory']}"
     )
@@ -390,28 +430,19 @@ def test_solve(D0, system):
         ka=system.ka,
         gt=system.gt,
         rg_params=system.rg_params,
-        L=L,
-        M=M,
+        L=system.L,
+        M=system.M,
         N=None,
         Q=Q,
-        R=R,
+        R=system.R,
         bcs=system.bcs,
     )
     modes = algorithms.get_nevp_modes(nevp_inputs)
     evals = np.asarray([mode.k for mode in modes])
 
-    D0_constant = real_const(system.V, D0) * system.pump_profile
-    nlp = NonLinearProblem(
-        system.V,
-        system.ka,
-        system.gt,
-        dielec=system.dielec,
-        pump=D0_constant * system.pump_profile,
-        n=system.n,
-        ds_obc=system.ds_obc,
-    )
-
-    newton_operators = newtils.create_multimode_solvers_and_matrices(nlp, max_nmodes=2)
+    nonlinear_problem.D0_constant.value = D0
+    nlp = nonlinear_problem.nlp
+    newton_operators = nonlinear_problem.newton_operators
 
     if False:
         modeselectors = np.argwhere(evals.imag > 0).flatten()
@@ -441,7 +472,7 @@ def test_solve(D0, system):
 
             if refined_mode.converged:
                 mode_values = system.evaluator(refined_mode)
-                mode_intensity = abs(mode_values) ** 2
+                mode_intensity = mode_values.real**2 + mode_values.imag**2
                 Print(f"-> {mode_intensity=}")
     else:
         multi_modes = algorithms.constant_pump_algorithm(
@@ -453,31 +484,33 @@ def test_solve(D0, system):
             first_mode_index=3,  # the first mode has k~15
         )
         multi_evals = np.asarray([mode.k for mode in multi_modes])
-        number_of_modes_close_to_real_axis = np.sum(np.abs(multi_evals.imag) < 1e-10)
+        number_of_modes_close_to_real_axis = np.count_nonzero(
+            np.abs(multi_evals.imag) < 1e-10
+        )
         assert number_of_modes_close_to_real_axis > 0
-        for mode in multi_modes:
-            mode_values = system.evaluator(mode)
-            mode_intensity = abs(mode_values) ** 2
+        # all modes are evaluated at once (one row per mode)
+        mode_values = system.evaluator(np.stack([mode.array for mode in multi_modes]))
+        for mode_intensity in mode_values.real**2 + mode_values.imag**2:
             Print(f"-> {mode_intensity=}")
 
 
-def test_intensity_vs_pump(system):
+def test_intensity_vs_pump(system, nonlinear_problem, hide_plots):
     # figure 6
     u = ufl.TrialFunction(system.V)
     v = ufl.TestFunction(system.V)
 
-    D0_constant = real_const(system.V, 1.0)
+    D0_constant = nonlinear_problem.D0_constant
 
-    L = assemble_form(
-        -system.invperm * inner(nabla_grad(u), nabla_grad(v)) * dx, system.bcs
-    )
-    M = assemble_form(system.dielec * inner(u, v) * dx, system.bcs, diag=0.0)
-    # this form is re-used in the constant_pump_algorithm
     with Timer(log.error, "assemble Q form"):
-        Q_form = fem.form(D0_constant * system.pump_profile * inner(u, v) * dx)
-    Q = assemble_form(Q_form, system.bcs, diag=0.0)
-    R = assemble_form(inner(u, v) * ds, system.bcs, diag=0.0)
+        Q_unit = assemble_form(
+            system.pump_profile * inner(u, v) * system.dx_pump,
+            system.bcs,
+            diag=0.0,
+            mat=system.L.duplicate(),
+        )
+    Q = Q_unit.duplicate()  # the values are set in the D0 loop
 
+    L = system.L
     Print(
         f"{L.getSize()=},  DOF: {L.getInfo()['nz_used']}, MEM: {L.getInfo()['memory']}"
     )
@@ -486,31 +519,23 @@ def test_intensity_vs_pump(system):
         ka=system.ka,
         gt=system.gt,
         rg_params=system.rg_params,
-        L=L,
-        M=M,
+        L=system.L,
+        M=system.M,
         N=None,
         Q=Q,
-        R=R,
+        R=system.R,
         bcs=system.bcs,
     )
 
-    nlp = NonLinearProblem(
-        system.V,
-        system.ka,
-        system.gt,
-        dielec=system.dielec,
-        n=system.n,
-        pump=D0_constant * system.pump_profile,
-        ds_obc=system.ds_obc,
-    )
-    newton_operators = newtils.create_multimode_solvers_and_matrices(nlp, max_nmodes=2)
+    nlp = nonlinear_problem.nlp
+    newton_operators = nonlinear_problem.newton_operators
 
     aevals = []  # all eigenvalues of the modes without the SHT
     results = []  # list of (D0, intensity) tuples
     for D0 in np.linspace(0.62, 1.27, 20):
         Print(f"{D0=}")
         D0_constant.value = D0
-        assemble_form(Q_form, system.bcs, diag=0.0, mat=Q)
+        algorithms.set_pump_matrix(Q, Q_unit, D0)
         modes = algorithms.get_nevp_modes(nevp_inputs)
         evals = np.asarray([mode.k for mode in modes])
         assert evals.size
@@ -528,16 +553,12 @@ def test_intensity_vs_pump(system):
             sht_modes = algorithms.get_nevp_modes(nevp_inputs)
 
             imag_evals = np.asarray([m.k.imag for m in sht_modes])
-            number_of_modes_close_to_real_axis = np.sum(np.abs(imag_evals) < 1e-10)
-            Print(
-                "Number of modes close to real axis: "
-                f"{number_of_modes_close_to_real_axis}"
-            )
+            (
+                number_of_modes_close_to_real_axis,
+                number_of_modes_above_real_axis,
+            ) = algorithms.count_modes_around_real_axis(imag_evals)
             assert number_of_modes_close_to_real_axis == 1
 
-            number_of_modes_above_real_axis = np.sum(imag_evals > 1e-10)
-            Print(f"Number of modes above real axis: {number_of_modes_above_real_axis}")
-
             return number_of_modes_above_real_axis == 0
 
         if False:
@@ -584,7 +605,7 @@ def test_intensity_vs_pump(system):
             # we only expect a single active laser mode
             assert len(single_mode_finder_results) == 1
             mode_values = system.evaluator(single_mode_finder_results[0])
-            mode_intensity = abs(mode_values) ** 2
+            mode_intensity = mode_values.real**2 + mode_values.imag**2
             Print(f"-> {mode_intensity=}")
             results.append((D0, mode.k.real, mode_intensity.sum()))
             aevals.append(evals)
@@ -599,18 +620,26 @@ def test_intensity_vs_pump(system):
                 # todo investigate eval trajectories
             )
             multi_evals = np.asarray([mode.k for mode in multi_modes])
-            number_of_modes_close_to_real_axis = np.sum(
+            number_of_modes_close_to_real_axis = np.count_nonzero(
                 np.abs(multi_evals.imag) < 1e-10
             )
             assert number_of_modes_close_to_real_axis > 0
-            for mode in multi_modes:
-                mode_values = system.evaluator(mode)
-                mode_intensity = abs(mode_values) ** 2
+            # all modes are evaluated at once (one row per mode)
+            mode_values = system.evaluator(
+                np.stack([mode.array for mode in multi_modes])
+            )
+            mode_intensities = mode_values.real**2 + mode_values.imag**2
+            for mode, mode_intensity, total_intensity in zip(
+                multi_modes, mode_intensities, mode_intensities.sum(axis=1)
+            ):
                 Print(f"-> {mode_intensity=}")
 
-                results.append((D0, mode.k.real, mode_intensity.sum()))
+                results.append((D0, mode.k.real, total_intensity))
             aevals.append(multi_evals)
 
+    if hide_plots:
+        return
+
     _, ax = plt.subplots()
 
     # we have to scale (in y) the intensities from the generalizations paper due to the
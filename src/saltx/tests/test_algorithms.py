@@ -0,0 +1,58 @@
+# Copyright (C) 2023 Thomas Hisch
+#
+# This file is part of saltx (https://github.com/thisch/saltx)
+#
+# SPDX-License-Identifier:    LGPL-3.0-or-later
+"""Unit tests of the algorithms.py module."""
+import numpy as np
+import pytest
+from dolfinx import fem, mesh
+from mpi4py import MPI
+
+from saltx.algorithms import Evaluator
+
+
+@pytest.fixture
+def V():
+    msh = mesh.create_unit_interval(MPI.COMM_WORLD, nx=10)
+    return fem.FunctionSpace(msh, ("Lagrange", 3))
+
+
+def random_modes(V, nmodes):
+    rng = np.random.default_rng(42)
+    ndofs = V.dofmap.index_map.size_local + V.dofmap.index_map.num_ghosts
+    return rng.random((nmodes, ndofs)) + 1j * rng.random((nmodes, ndofs))
+
+
+def test_evaluator_single_mode(V):
+    points = np.linspace(0.0, 1.0, 7)
+    evaluator = Evaluator(V, V.mesh, points)
+
+    # f(x) = x**3 is exactly represented by the P3 elements
+    func = fem.Function(V)
+    func.interpolate(lambda x: x[0] ** 3 + 0.5j * x[0])
+
+    values = evaluator(func.x.array)
+    np.testing.assert_allclose(values, points**3 + 0.5j * points, atol=1e-12)
+
+
+def test_evaluator_multiple_modes(V):
+    evaluator = Evaluator(V, V.mesh, np.linspace(0.0, 1.0, 13))
+    modes = random_modes(V, nmodes=3)
+
+    values = evaluator(modes)
+    assert values.shape == (3, 13)
+    for mode, mode_values in zip(modes, values):
+        np.testing.assert_allclose(mode_values, evaluator(mode), atol=1e-12)
+
+    # the cached basis values are used for the second call
+    np.testing.assert_array_equal(evaluator(modes), values)
+
+
+def test_evaluator_without_local_points(V):
+    # the points are outside of the mesh
+    evaluator = Evaluator(V, V.mesh, np.array([2.0, 3.0]))
+    modes = random_modes(V, nmodes=2)
+
+    assert evaluator(modes[0]).shape == (0,)
+    assert evaluator(modes).shape == (2, 0)
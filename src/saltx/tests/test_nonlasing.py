@@ -0,0 +1,146 @@
+# Copyright (C) 2023 Thomas Hisch
+#
+# This file is part of saltx (https://github.com/thisch/saltx)
+#
+# SPDX-License-Identifier:    LGPL-3.0-or-later
+"""Unit tests of the nonlasing.py module."""
+import numpy as np
+import ufl
+from dolfinx import fem, mesh
+from mpi4py import MPI
+from petsc4py import PETSc
+from ufl import dx, inner, nabla_grad
+
+from saltx.nonlasing import NonLasingLinearProblem
+
+ka = 10.0
+gt = 4.0
+
+
+def create_nllp(sigma_c=None):
+    msh = mesh.create_unit_interval(MPI.COMM_WORLD, nx=20)
+    V = fem.FunctionSpace(msh, ("Lagrange", 3))
+
+    # Dirichlet boundary condition on the left, open boundary condition on the right
+    bcs_dofs = fem.locate_dofs_geometrical(V, lambda x: np.isclose(x[0], 0.0))
+    bcs = [fem.dirichletbc(PETSc.ScalarType(0), bcs_dofs, V)]
+
+    dielec = fem.Function(fem.FunctionSpace(msh, ("DG", 0)))
+    dielec.x.array[:] = 1.2**2
+    pump = fem.Constant(msh, complex(0.3, 0))
+
+    nllp = NonLasingLinearProblem(
+        V=V,
+        ka=ka,
+        gt=gt,
+        dielec=dielec,
+        invperm=None,
+        pump=pump,
+        bcs=bcs,
+        ds_obc=ufl.ds,
+    )
+    if sigma_c is not None:
+        nllp.sigma_c = fem.Constant(msh, complex(sigma_c, 0))
+        nllp.create_forms()
+    return nllp
+
+
+def create_initial_x(nllp, k, dof_at_maximum):
+    rng = np.random.default_rng(42)
+    n = nllp.n
+    b = rng.random(n) + 1j * rng.random(n)
+    b[dof_at_maximum] = 1.0
+
+    x = nllp.create_dx(n)
+    x.setValues(range(n), b)
+    x.setValue(n, k)
+    x.assemble()
+    return x
+
+
+def test_create_A():
+    nllp = create_nllp()
+    n = nllp.n
+
+    # A is created before anything was assembled into the dF/du matrix
+    A = nllp.create_A(n)
+    L = nllp.create_L(n)
+    assert A.getSize() == (n + 1, n + 1)
+    assert L.getSize() == n + 1
+    # every Newton solver gets its own matrix and vector
+    assert nllp.create_A(n) is not A
+    assert nllp.create_L(n) is not L
+
+    dof_at_maximum = n // 2
+    x = create_initial_x(nllp, 10.3 - 0.2j, dof_at_maximum)
+    nllp.assemble_F_and_J(L, A, x, dof_at_maximum)
+
+    # the preallocation of A covers all the entries of the jacobian
+    assert A.getInfo()["mallocs"] == 0
+    cols, values = A.getRow(n)
+    np.testing.assert_array_equal(cols, [dof_at_maximum, n])
+    np.testing.assert_array_equal(values, [1.0, 0.0])
+
+
+def test_assemble_F_and_J():
+    nllp = create_nllp(sigma_c=0.05)
+    n = nllp.n
+    V = nllp.V
+
+    A = nllp.create_A(n)
+    L = nllp.create_L(n)
+
+    k_value = 10.3 - 0.2j
+    dof_at_maximum = n // 2
+    x = create_initial_x(nllp, k_value, dof_at_maximum)
+    nllp.assemble_F_and_J(L, A, x, dof_at_maximum)
+
+    # reference forms of F, dF/dk and dF/du (assembled without the matrix-vector
+    # products of NonLasingLinearProblem)
+    k = fem.Constant(V.mesh, k_value)
+    b = fem.Function(V)
+    b.x.array[:] = x.getArray(readonly=True)[:n]
+    gammak = gt / (k - ka + 1j * gt)
+    dgammak_dk = -gt / (k - ka + 1j * gt) ** 2
+
+    u = ufl.TrialFunction(V)
+    v = ufl.TestFunction(V)
+    M = nllp.dielec * inner(u, v) * dx
+    Q = nllp.pump * inner(u, v) * dx
+    R = inner(u, v) * ufl.ds
+    N = nllp.sigma_c * inner(u, v) * dx
+
+    dFdu = (
+        -inner(nabla_grad(u), nabla_grad(v)) * dx
+        + k**2 * M
+        + k**2 * gammak * Q
+        + 1j * k * R
+        + 1j * k * N
+    )
+    dFdk = 2 * k * M + (2 * k * gammak + k**2 * dgammak_dk) * Q + 1j * R + 1j * N
+
+    bc_dofs = nllp.bcs[0].dof_indices()[0]
+    free_dofs = np.setdiff1d(np.arange(n), bc_dofs)
+    for vec, form in [
+        (nllp.vec_F_petsc, dFdu),
+        (nllp.vec_dF_dk, dFdk),
+    ]:
+        ref = fem.petsc.assemble_vector(fem.form(ufl.action(form, b)))
+        ref.ghostUpdate(addv=PETSc.InsertMode.ADD, mode=PETSc.ScatterMode.REVERSE)
+        values = vec.getArray(readonly=True)
+        np.testing.assert_allclose(
+            values[free_dofs],
+            ref.getArray(readonly=True)[free_dofs],
+            rtol=1e-10,
+            atol=1e-10,
+        )
+        np.testing.assert_array_equal(values[bc_dofs], 0.0)
+
+    ref_dF_du = fem.petsc.assemble_matrix(fem.form(dFdu), bcs=nllp.bcs, diagonal=1.0)
+    ref_dF_du.assemble()
+    np.testing.assert_allclose(
+        nllp.mat_dF_du.convert("dense").getDenseArray(),
+        ref_dF_du.convert("dense").getDenseArray(),
+        rtol=1e-10,
+        atol=1e-10,
+    )